@@ -16,23 +16,13 @@ echo "Starting Synthetic Data Generation..."
 # python -m services.etl.clean_anime
 # python -m services.etl.build_implicit_signals
 
-# Generate synthetic users and ratings
-python -m services.ml.synthetic_cf
+# Generate synthetic users/ratings, then train and save every model artifact.
+# Steps are declared in services/ml/pipeline.py; steps whose inputs are
+# unchanged since the last run are skipped, and independent steps
+# (content_model, als_model) run in parallel.
+python -m services.ml.pipeline
 
-# echo "Data preparation complete. Starting model training..."
-
-# --- 3. Run Model Training Scripts ---
-
-# Train Content-Based Model and save artifacts
-# python -m services.ml.content_model
-
-# Train Collaborative Filtering Model and save artifacts
-# python -m services.ml.als_model
-
-# Build Hybrid Model (which loads and combines the above) and save artifact
-# python -m services.ml.hybrid_model
-
-# echo "All ML models trained and artifacts saved."
+echo "All ML models trained and artifacts saved."
 
 # --- 4. Keep container running (Crucial for a service) ---
 # This ensures the container stays alive after the setup finishes
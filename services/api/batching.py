@@ -0,0 +1,91 @@
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+
+class BatcherOverloaded(Exception):
+    """Raised when too many requests are already waiting for a batch"""
+
+
+def _freeze(value):
+    """Hashable form of request parameters, used to group compatible requests"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class MicroBatcher:
+    """
+    Groups concurrent single-user calls that share parameters into one
+    batch_fn(user_ids, **params) call, which must return one result per user.
+
+    While fewer than max_concurrent_batches batches are running a request is
+    dispatched immediately, so a server with spare capacity adds no latency.
+    Otherwise requests accumulate until the group reaches max_batch_size or
+    its oldest request has waited max_wait_ms.
+    At most max_pending requests may wait; beyond that submit() raises
+    BatcherOverloaded so callers can shed load.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=32, max_wait_ms=3.0, max_pending=1024, max_concurrent_batches=2):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_pending = max_pending
+        self.max_concurrent_batches = max_concurrent_batches
+
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_batches)
+        # params key -> (params, [(user_id, future)], timer handle)
+        self._groups = {}
+        self._pending = 0
+        self._in_flight = 0
+
+    async def submit(self, user_id, **params):
+        if self._pending >= self.max_pending:
+            raise BatcherOverloaded(f"{self._pending} requests already waiting")
+
+        loop = asyncio.get_running_loop()
+        key = _freeze(params)
+        future = loop.create_future()
+
+        if key not in self._groups:
+            timer = loop.call_later(self.max_wait, self._flush, key)
+            self._groups[key] = (params, [], timer)
+        _, waiting, _ = self._groups[key]
+        waiting.append((user_id, future))
+        self._pending += 1
+
+        if self._in_flight < self.max_concurrent_batches or len(waiting) >= self.max_batch_size:
+            self._flush(key)
+
+        return await future
+
+    def _flush(self, key):
+        group = self._groups.pop(key, None)
+        if group is None:
+            return
+        params, waiting, timer = group
+        timer.cancel()
+
+        self._in_flight += 1
+        asyncio.get_running_loop().create_task(self._run(params, waiting))
+
+    async def _run(self, params, waiting):
+        loop = asyncio.get_running_loop()
+        user_ids = [user_id for user_id, _ in waiting]
+        try:
+            results = await loop.run_in_executor(self._executor, partial(self.batch_fn, user_ids, **params))
+        except Exception as e:
+            for _, future in waiting:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future), result in zip(waiting, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            self._pending -= len(waiting)
+            self._in_flight -= 1
@@ -1,5 +1,6 @@
+import os
+
 from fastapi import FastAPI
-from api.routes.recommend import router as recommend_router
 
 app = FastAPI(
     title="Anime Recommendation API",
@@ -7,11 +8,30 @@ app = FastAPI(
 )
 
 # Register routes
-app.include_router(
-    recommend_router,
-    prefix="/api",
-    tags=["recommendations"],
-)
+if os.getenv("SHARD_URLS"):
+    # Router mode: the engine lives in the shard processes
+    from api.routes.sharded import router as sharded_router
+
+    app.include_router(
+        sharded_router,
+        prefix="/api",
+        tags=["recommendations"],
+    )
+else:
+    from api.routes.recommend import router as recommend_router
+    from api.routes.admin import router as admin_router
+
+    app.include_router(
+        recommend_router,
+        prefix="/api",
+        tags=["recommendations"],
+    )
+
+    app.include_router(
+        admin_router,
+        prefix="/api/admin",
+        tags=["admin"],
+    )
 
 @app.get("/")
 def root():
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Header, Query, HTTPException
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+
+from api.routes.recommend import profiles, PROFILE_ADMIN_TOKEN
+
+router = APIRouter()
+
+
+def require_admin(token):
+    if not PROFILE_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Profiling admin endpoints are disabled")
+    if token != PROFILE_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@router.get("/profiles")
+def list_profiles(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    summaries = profiles.list()
+    return {"num_profiles": len(summaries), "profiles": summaries}
+
+
+@router.get("/profiles/{profile_id}")
+def get_profile(
+    profile_id: int,
+    format: str = Query("json", pattern="^(json|folded)$"),
+    x_admin_token: Optional[str] = Header(None),
+):
+    """`format=folded` returns flame-graph input (flamegraph.pl / speedscope)."""
+    require_admin(x_admin_token)
+    current = profiles.get(profile_id)
+    if current is None:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+
+    if format == "folded":
+        return PlainTextResponse(current.to_folded())
+    return current.to_dict()
@@ -1,26 +1,175 @@
-from fastapi import APIRouter, Query, HTTPException
+from fastapi import APIRouter, Body, Header, Query, HTTPException
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+import importlib
 import joblib
+import os
+import random
 from pathlib import Path
 
+from api.batching import MicroBatcher, BatcherOverloaded
+
 router = APIRouter()
 
-ARTIFACTS_PATH = Path("/app/ml/artifacts")
+ARTIFACTS_PATH = Path(os.getenv("ARTIFACTS_PATH", "/app/ml/artifacts"))
 MODEL_FILENAME = "hybrid_recommender_engine.joblib"
 
-engine = joblib.load(ARTIFACTS_PATH / MODEL_FILENAME)
+# With SHARD_ID set this process is one shard of a sharded deployment and
+# holds only its users' factors (see ml.sharding and api.routes.sharded)
+SHARD_ID = os.getenv("SHARD_ID")
+if SHARD_ID is not None:
+    from ml.sharding import load_shard_engine
+    engine = load_shard_engine(int(SHARD_ID))
+else:
+    engine = joblib.load(ARTIFACTS_PATH / MODEL_FILENAME)
+
+# Fold-ins are kept per process unless FOLD_IN_REDIS_URL names a Redis shared
+# by every worker; without it, run a single worker (or one per shard) or a
+# fold-in only reaches the worker that handled it
+FOLD_IN_REDIS_URL = os.getenv("FOLD_IN_REDIS_URL")
+if FOLD_IN_REDIS_URL:
+    import redis
+    from ml.factor_overlay import RedisFactorOverlay
+
+    engine.user_factor_overlay = RedisFactorOverlay(
+        redis.Redis.from_url(FOLD_IN_REDIS_URL),
+        namespace=f"v{engine.cf_artifacts.get('version', 1)}",
+    )
+
+# The engine may be unpickled from services.ml.* while this app imports ml.*;
+# those are separate module copies with separate thread-locals, so the profiler
+# must come from the engine's own package for its stages to record into it
+profiling = importlib.import_module(type(engine).__module__.rsplit(".", 1)[0] + ".profiling")
+profile, ProfileStore = profiling.profile, profiling.ProfileStore
+
+# Opt-in request profiling: sampled at PROFILE_SAMPLE_RATE, or forced by
+# sending X-Profile with the admin token
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN")
+profiles = ProfileStore(maxlen=int(os.getenv("PROFILE_STORE_SIZE", "50")))
+
+
+# Optional micro-batching of concurrent recommendation requests
+batcher = None
+if os.getenv("RECOMMEND_BATCHING", "0") == "1":
+    batcher = MicroBatcher(
+        engine.recommend_batch_with_report,
+        max_batch_size=int(os.getenv("RECOMMEND_MAX_BATCH_SIZE", "32")),
+        max_wait_ms=float(os.getenv("RECOMMEND_BATCH_WINDOW_MS", "3")),
+        max_pending=int(os.getenv("RECOMMEND_MAX_PENDING", "1024")),
+        max_concurrent_batches=int(os.getenv("RECOMMEND_MAX_CONCURRENT_BATCHES", "4")),
+    )
+
+
+def should_profile(token):
+    if PROFILE_ADMIN_TOKEN and token == PROFILE_ADMIN_TOKEN:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
 
 @router.get("/recommendations/{user_id}")
-def recommend(
+async def recommend(
     user_id: int,
-    limit: int = Query(10, ge=1, le=50)
+    limit: int = Query(10, ge=1, le=50),
+    preferred_genres: Optional[List[str]] = Query(None),
+    genres: Optional[List[str]] = Query(None),
+    studios: Optional[List[str]] = Query(None),
+    types: Optional[List[str]] = Query(None),
+    ratings: Optional[List[str]] = Query(None),
+    years: Optional[List[str]] = Query(None, description="Decade buckets, e.g. 1990s"),
+    exclude_seen: bool = Query(False),
+    budget_ms: Optional[float] = Query(None, gt=0, description="Candidate-generation latency budget"),
+    x_profile: Optional[str] = Header(None),
 ):
+    filters = {
+        "genre": genres,
+        "studio": studios,
+        "type": types,
+        "rating": ratings,
+        "year": years,
+    }
+    params = {
+        "limit": limit,
+        "preferred_genres": preferred_genres,
+        "filters": filters,
+        "exclude_seen": exclude_seen,
+    }
+
+    def run_profiled():
+        with profile(f"recommend user_id={user_id}", store=profiles) as current:
+            results, report = engine.recommend_with_report(user_id, budget_ms=budget_ms, **params)
+        return results, report, current.profile_id
+
+    profile_id = None
     try:
-        results = engine.recommend(user_id, limit=limit)
+        if should_profile(x_profile):
+            results, report, profile_id = await run_in_threadpool(run_profiled)
+        elif batcher is not None:
+            results, report = await batcher.submit(user_id, budget_ms=budget_ms, **params)
+        else:
+            results, report = await run_in_threadpool(
+                engine.recommend_with_report, user_id, budget_ms=budget_ms, **params
+            )
+    except BatcherOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e)) from e
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e)) from e
 
-    return {
+    response = {
         "user_id": user_id,
         "num_results": len(results),
         "recommendations": results,
+        "candidate_sources": report,
+    }
+    if profile_id is not None:
+        response["profile_id"] = profile_id
+    return response
+
+
+@router.get("/shard")
+def shard_info():
+    info = getattr(engine, "shard", None)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Not running as a shard")
+    return info
+
+
+@router.get("/anime/{anime_id}/similar")
+def similar(
+    anime_id: int,
+    limit: int = Query(10, ge=1, le=50),
+    genre: Optional[str] = Query(None),
+    anime_type: Optional[str] = Query(None, alias="type"),
+):
+    try:
+        results = engine.similar(anime_id, limit=limit, genre=genre, anime_type=anime_type)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f"Unknown anime_id {anime_id}") from e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+    return {
+        "anime_id": anime_id,
+        "num_results": len(results),
+        "similar": results,
     }
+
+
+@router.post("/users/{user_id}/fold-in")
+def fold_in(user_id: int):
+    """Compute CF factors for a user from their current ratings without retraining."""
+    try:
+        folded = engine.fold_in(user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+    return {"user_id": user_id, "folded_in": folded}
+
+
+@router.post("/users/fold-in")
+def fold_in_many(user_ids: List[int] = Body(..., embed=True)):
+    try:
+        folded = engine.fold_in_many(user_ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+    return {"num_folded_in": len(folded), "user_ids": folded}
@@ -0,0 +1,142 @@
+"""
+Router mode: forward requests to the shard that owns the user.
+
+Enabled when SHARD_URLS lists the shard processes' base URLs, in shard order.
+User-scoped endpoints go to ring.shard_for(user_id); /similar only needs item
+data, which every shard has, so it is spread across shards by anime_id.
+
+The ring is built from the parameters the shards report at startup, not from
+local settings, and the router refuses to start if any shard is unreachable
+or disagrees: a mismatched ring would send users to a shard without their
+factors and silently serve them cold-start results.
+"""
+import asyncio
+import os
+import time
+
+import httpx
+from fastapi import APIRouter, Body, HTTPException, Request, Response
+from typing import List
+
+from ml.sharding import HashRing
+
+router = APIRouter()
+
+SHARD_URLS = [url.strip().rstrip("/") for url in os.getenv("SHARD_URLS", "").split(",") if url.strip()]
+# How long to wait for shards to come up before refusing to start
+SHARD_STARTUP_TIMEOUT_S = float(os.getenv("SHARD_STARTUP_TIMEOUT_S", "60"))
+
+
+def shard_mismatch(i, info):
+    """Why the shard at SHARD_URLS[i] does not fit this router, or None"""
+    if info.get("shard_id") != i:
+        return f"{SHARD_URLS[i]} is shard {info.get('shard_id')}, expected {i}"
+    if info.get("num_shards") != len(SHARD_URLS):
+        return f"{SHARD_URLS[i]} was built for {info.get('num_shards')} shards, router has {len(SHARD_URLS)}"
+    return None
+
+def discover_ring():
+    """HashRing matching the shards' own build parameters; raises if they disagree"""
+    deadline = time.time() + SHARD_STARTUP_TIMEOUT_S
+    infos = []
+    for url in SHARD_URLS:
+        while True:
+            try:
+                response = httpx.get(f"{url}/api/shard", timeout=5)
+                response.raise_for_status()
+                infos.append(response.json())
+                break
+            except httpx.HTTPError as e:
+                if time.time() > deadline:
+                    raise RuntimeError(f"Shard {url} unavailable: {e}") from e
+                time.sleep(0.5)
+
+    problems = [shard_mismatch(i, info) for i, info in enumerate(infos)]
+    problems = [p for p in problems if p is not None]
+    virtual_nodes = {info.get("virtual_nodes") for info in infos}
+    if len(virtual_nodes) > 1:
+        problems.append(f"shards disagree on virtual_nodes: {sorted(virtual_nodes, key=str)}")
+    if problems:
+        raise RuntimeError("Inconsistent shard deployment: " + "; ".join(problems))
+
+    return HashRing(len(SHARD_URLS), virtual_nodes.pop())
+
+
+ring = discover_ring()
+
+client = httpx.AsyncClient(timeout=float(os.getenv("SHARD_TIMEOUT_S", "10")))
+
+FORWARDED_HEADERS = ("x-profile",)
+
+
+async def call_shard(shard, method, path, request=None, **kwargs):
+    url = f"{SHARD_URLS[shard]}/api{path}"
+    if request is not None:
+        kwargs.setdefault("params", request.query_params.multi_items())
+        kwargs.setdefault("headers", {
+            name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers
+        })
+    try:
+        return await client.request(method, url, **kwargs)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Shard {shard} unavailable: {e}") from e
+
+def relay(response, shard):
+    return Response(
+        content=response.content,
+        status_code=response.status_code,
+        media_type=response.headers.get("content-type", "application/json"),
+        headers={"X-Shard": str(shard)},
+    )
+
+
+@router.get("/recommendations/{user_id}")
+async def recommend(user_id: int, request: Request):
+    shard = ring.shard_for(user_id)
+    return relay(await call_shard(shard, "GET", f"/recommendations/{user_id}", request), shard)
+
+
+@router.get("/anime/{anime_id}/similar")
+async def similar(anime_id: int, request: Request):
+    shard = ring.shard_for(anime_id)
+    return relay(await call_shard(shard, "GET", f"/anime/{anime_id}/similar", request), shard)
+
+
+@router.post("/users/{user_id}/fold-in")
+async def fold_in(user_id: int):
+    shard = ring.shard_for(user_id)
+    return relay(await call_shard(shard, "POST", f"/users/{user_id}/fold-in"), shard)
+
+
+@router.post("/users/fold-in")
+async def fold_in_many(user_ids: List[int] = Body(..., embed=True)):
+    groups = ring.partition(user_ids)
+    responses = await asyncio.gather(*(
+        call_shard(shard, "POST", "/users/fold-in", json={"user_ids": members})
+        for shard, members in groups.items()
+    ))
+
+    folded = []
+    for shard, response in zip(groups, responses):
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code, detail=f"Shard {shard}: {response.text}")
+        folded += response.json()["user_ids"]
+
+    return {"num_folded_in": len(folded), "user_ids": folded}
+
+
+@router.get("/shards")
+async def shards():
+    """Each shard's identity, and whether it matches its position in SHARD_URLS and the router's ring"""
+    responses = await asyncio.gather(*(call_shard(i, "GET", "/shard") for i in range(len(SHARD_URLS))))
+
+    shards = []
+    for i, response in enumerate(responses):
+        info = response.json() if response.status_code == 200 else {}
+        shards.append({
+            "url": SHARD_URLS[i],
+            **info,
+            "consistent": shard_mismatch(i, info) is None and info.get("virtual_nodes") == ring.virtual_nodes,
+        })
+
+    return {"num_shards": len(SHARD_URLS), "virtual_nodes": ring.virtual_nodes, "shards": shards}
@@ -9,11 +9,22 @@ from scipy.sparse import csr_matrix
 from implicit.als import AlternatingLeastSquares
 
 from .db import engine
+from .profiling import profile_from_env
+from .snapshot import USE_SNAPSHOTS, read_snapshot
 
-ARTIFACTS_PATH = "/app/services/ml/artifacts/" 
+ARTIFACTS_PATH = os.getenv("ML_ARTIFACTS_PATH", "/app/services/ml/artifacts/")
 MODEL_FILENAME = "als_model_artifacts.joblib"
 
+# Retrain from the previously saved factors and id maps instead of from scratch
+WARM_START = os.getenv("ALS_WARM_START", "0") == "1"
+# Stop once an iteration improves the training loss by less than this fraction
+TOLERANCE = float(os.getenv("ALS_TOLERANCE", "1e-3"))
+
 def load_ratings():
+    if USE_SNAPSHOTS:
+        ratings = read_snapshot("user_ratings", columns=["user_id", "anime_id", "rating", "source"])
+        ratings = ratings[ratings["source"] == "synthetic"]
+        return ratings.drop(columns="source").reset_index(drop=True)
     query = """
         SELECT user_id, anime_id, rating
         FROM user_ratings
@@ -21,12 +32,21 @@ def load_ratings():
     """
     return pd.read_sql(query, engine)
 
-def build_interaction_matrix(df):
-    user_ids = df["user_id"].unique()
-    anime_ids = df["anime_id"].unique()
+def extend_id_map(id_map, ids):
+    """Append unseen ids to an existing id -> index map; existing indices never move"""
+    id_map = dict(id_map or {})
+    for i in ids:
+        if i not in id_map:
+            id_map[i] = len(id_map)
+    return id_map
 
-    user_map = {u: i for i, u in enumerate(user_ids)}
-    anime_map = {a: i for i, a in enumerate(anime_ids)}
+def build_interaction_matrix(df, user_map=None, anime_map=None):
+    """
+    Pass the previous run's user_map/anime_map to keep indices stable
+    across retrains (append-only).
+    """
+    user_map = extend_id_map(user_map, df["user_id"].unique())
+    anime_map = extend_id_map(anime_map, df["anime_id"].unique())
 
     rows = df["user_id"].map(user_map)
     cols = df["anime_id"].map(anime_map)
@@ -42,26 +62,110 @@ def build_interaction_matrix(df):
 
     return matrix, user_map, anime_map
 
-def train_als(interaction_matrix):
+def _warm_factors(previous, n_rows, n_factors, rng):
+    """Previous factors for known rows, implicit-style small random init for new rows"""
+    factors = (rng.random((n_rows, n_factors)) * 0.01).astype(np.float32)
+    previous = np.asarray(previous, dtype=np.float32)
+    factors[:len(previous)] = previous
+    return factors
+
+class _Converged(Exception):
+    """Raised from the fit callback to end training early"""
+
+def train_als(interaction_matrix, previous_model=None, tolerance=None, iterations=30):
+    """
+    Fit ALS on a users x items matrix. With `previous_model`, factors are
+    initialized from its user/item factors (rows beyond them are new ids).
+    With `tolerance`, training stops once an iteration lowers the training
+    loss by less than that fraction of the previous loss.
+    """
     model = AlternatingLeastSquares(
         factors=64,
         regularization=0.05,
-        iterations=30,
+        iterations=iterations,
+        calculate_training_loss=tolerance is not None,
         random_state=42
     )
 
-    # implicit expects item-user matrix (items x users)
-    # convert to CSR to ensure correct sparse format and fit
-    model.fit(csr_matrix(interaction_matrix.T))
+    # implicit >= 0.5 expects a user-item matrix (users x items); passing the
+    # transpose swaps user_factors and item_factors
+    user_items = csr_matrix(interaction_matrix)
+
+    if previous_model is not None:
+        # implicit only initializes factors that are still None
+        rng = np.random.default_rng(42)
+        model.user_factors = _warm_factors(previous_model.user_factors, user_items.shape[0], model.factors, rng)
+        model.item_factors = _warm_factors(previous_model.item_factors, user_items.shape[1], model.factors, rng)
+
+    if tolerance is None:
+        model.fit(user_items)
+        return model
 
+    losses = []
+
+    def stop_when_converged(iteration, elapsed, loss):
+        # implicit updates the factors in place, so raising here keeps
+        # everything fitted so far
+        losses.append(loss)
+        if len(losses) > 1 and losses[-2] - loss <= tolerance * abs(losses[-2]):
+            raise _Converged
+
+    try:
+        model.fit(user_items, show_progress=False, callback=stop_when_converged)
+    except _Converged:
+        print(f"ALS converged after {len(losses)} iterations (loss {losses[-1]:.6f})")
+
+    model.iterations = len(losses)
     return model
 
+def fold_in_users(item_factors, user_items, regularization=0.05, alpha=1.0, chunk_size=1024):
+    """
+    Solve user factor vectors with item factors held fixed, using the same
+    implicit-ALS objective as training (confidence C = alpha * value):
+        (Y^T Y + Y^T (C_u - I) Y + reg * I) x_u = Y^T C_u p_u
+    user_items: users x items CSR of confidence values (rating / 10).
+    Returns a float32 (n_users, factors) array.
+    """
+    Y = np.asarray(item_factors, dtype=np.float64)
+    n_factors = Y.shape[1]
+    YtY = Y.T @ Y + regularization * np.eye(n_factors)
+
+    user_items = csr_matrix(user_items)
+    n_users = user_items.shape[0]
+    user_factors = np.zeros((n_users, n_factors), dtype=np.float32)
+
+    # Solve in chunks so the stacked (chunk, f, f) systems stay small
+    for start in range(0, n_users, chunk_size):
+        stop = min(start + chunk_size, n_users)
+        A = np.repeat(YtY[None, :, :], stop - start, axis=0)
+        b = np.zeros((stop - start, n_factors))
+
+        for row, u in enumerate(range(start, stop)):
+            lo, hi = user_items.indptr[u], user_items.indptr[u + 1]
+            Yu = Y[user_items.indices[lo:hi]]
+            confidence = alpha * user_items.data[lo:hi]
+            A[row] += (Yu * (confidence - 1.0)[:, None]).T @ Yu
+            b[row] = confidence @ Yu
+
+        user_factors[start:stop] = np.linalg.solve(A, b[..., None])[..., 0]
+
+    return user_factors
+
+def fold_in_user(item_factors, item_idxs, confidence, regularization=0.05, alpha=1.0):
+    """Single-user fold_in_users: item_idxs are ALS item indices, confidence = rating / 10."""
+    item_idxs = np.asarray(item_idxs)
+    user_items = csr_matrix(
+        (np.asarray(confidence, dtype=np.float64), (np.zeros(len(item_idxs), dtype=np.int64), item_idxs)),
+        shape=(1, len(item_factors))
+    )
+    return fold_in_users(item_factors, user_items, regularization, alpha)[0]
+
 def recommend_for_user(model, interaction_matrix, user_map, anime_map, user_id, k=10):
     user_idx = user_map[user_id]
 
     scores, item_idxs = model.recommend(
         user_idx,
-        csr_matrix(interaction_matrix),
+        csr_matrix(interaction_matrix)[user_idx],
         N=k
     )
 
@@ -73,16 +177,32 @@ def recommend_for_user(model, interaction_matrix, user_map, anime_map, user_id,
     ]
 
 
-def build_cf_model():
-    ratings = load_ratings()
-    matrix, user_map, anime_map = build_interaction_matrix(ratings)
-    model = train_als(matrix)
+def build_cf_model(ratings=None, previous=None, tolerance=None):
+    """
+    `previous`: artifacts from an earlier build_cf_model to warm-start from.
+    Its id maps are extended rather than rebuilt, so factor rows for existing
+    users and anime keep their indices across versions.
+    """
+    if ratings is None:
+        ratings = load_ratings()
+
+    if previous is None:
+        matrix, user_map, anime_map = build_interaction_matrix(ratings)
+        model = train_als(matrix, tolerance=tolerance)
+        version = 1
+    else:
+        matrix, user_map, anime_map = build_interaction_matrix(
+            ratings, previous["user_map"], previous["anime_map"]
+        )
+        model = train_als(matrix, previous_model=previous["model"], tolerance=tolerance)
+        version = previous.get("version", 1) + 1
 
     return {
         "model": model,
         "interaction_matrix": matrix,
         "user_map": user_map,
         "anime_map": anime_map,
+        "version": version,
     }
     
 def save_model(model_artifacts, path):
@@ -94,8 +214,15 @@ def save_model(model_artifacts, path):
 
 if __name__ == "__main__":
     os.makedirs(ARTIFACTS_PATH, exist_ok=True)
-    artifacts = build_cf_model()
-    print("ALS model trained")
-    
     full_path = os.path.join(ARTIFACTS_PATH, MODEL_FILENAME)
+
+    previous = None
+    if WARM_START and os.path.exists(full_path):
+        previous = joblib.load(full_path)
+        print(f"Warm-starting from ALS artifacts version {previous.get('version', 1)}")
+
+    with profile_from_env("als_model"):
+        artifacts = build_cf_model(previous=previous, tolerance=TOLERANCE if previous else None)
+    print(f"ALS model trained ({artifacts['model'].iterations} iterations)")
+    
     save_model(artifacts, full_path)
\ No newline at end of file
@@ -0,0 +1,74 @@
+import time
+import numpy as np
+import pandas as pd
+
+from .evaluate import load_artifacts, get_user_ratings, precision_at_k, coverage_metric
+
+MODES = ("sparse", "dense")
+
+
+def time_content_scoring(hybrid_engine, user_ids, candidates, liked_by_user, repeats=3):
+    """Median per-user latency (ms) of content scoring, excluding the DB fetch"""
+    timings = []
+    for uid in user_ids:
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            hybrid_engine._calculate_content_scores(uid, candidates, liked_items=liked_by_user[uid])
+            best = min(best, time.perf_counter() - start)
+        timings.append(best * 1000)
+    return timings
+
+
+def run_benchmark(n_users: int = 100, N: int = 10):
+    np.random.seed(42)
+    cf, cb, hybrid = load_artifacts()
+    anime_df = cb['anime_df']
+    candidates = anime_df['anime_id'].tolist()
+
+    ratings = get_user_ratings()
+    eligible = list(set(cf['user_map'].keys()).intersection(set(ratings['user_id'].unique())))
+    if not eligible:
+        raise SystemExit('No eligible users for benchmark')
+    test_users = np.random.choice(eligible, size=min(n_users, len(eligible)), replace=False)
+
+    liked_by_user = {}
+    test_sets = {}
+    for uid in test_users:
+        u = ratings[ratings['user_id'] == uid]
+        liked_by_user[uid] = u.loc[u['rating'] >= 7.0, 'anime_id'].tolist()
+        test_sets[uid] = set(u.sort_values("rating", ascending=False).head(20)["anime_id"])
+
+    original_mode = hybrid.content_mode
+    results = {}
+
+    for mode in MODES:
+        hybrid.content_mode = mode
+        timings = time_content_scoring(hybrid, test_users, candidates, liked_by_user)
+
+        precisions = []
+        all_recs = {}
+        for uid in test_users:
+            scores = hybrid._calculate_content_scores(uid, candidates, liked_items=liked_by_user[uid])
+            for aid in liked_by_user[uid]:
+                scores.pop(aid, None)
+            recs = [int(aid) for aid, _ in sorted(scores.items(), key=lambda x: x[1], reverse=True)[:N]]
+            all_recs[uid] = recs
+            precisions.append(precision_at_k(recs, test_sets[uid], k=N))
+
+        results[mode] = {
+            'p50 ms': float(np.percentile(timings, 50)),
+            'p95 ms': float(np.percentile(timings, 95)),
+            f'Precision@{N}': float(np.mean(precisions)),
+            'Coverage': coverage_metric(all_recs, total_items=len(anime_df)),
+        }
+
+    hybrid.content_mode = original_mode
+
+    df = pd.DataFrame(results).T
+    print(df.to_markdown(floatfmt='.4f'))
+    return df
+
+
+if __name__ == '__main__':
+    run_benchmark()
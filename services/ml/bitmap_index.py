@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+
+from .db import engine
+from .snapshot import USE_SNAPSHOTS, read_snapshot
+
+# Facets accepted by BitmapIndex.query, in the order filters are applied
+FACETS = ("genre", "studio", "type", "rating", "year")
+
+
+def load_catalog():
+    if USE_SNAPSHOTS:
+        return read_snapshot("anime", columns=["anime_id", "type", "rating", "year"])
+    query = """
+        SELECT anime_id, type, rating, year
+        FROM anime
+    """
+    return pd.read_sql(query, engine)
+
+def year_bucket(year):
+    """Decade label used for the year facet, e.g. 1998 -> '1990s'"""
+    return f"{int(year) // 10 * 10}s"
+
+
+class BitmapIndex:
+    """
+    Packed bitmaps over the catalog, one per facet value. Bit i refers to
+    the i-th anime_id in ascending order, so any set of anime_ids (a genre,
+    a user's seen-set) becomes a bitmap of the same length and filters
+    combine with vectorized AND / OR / AND NOT.
+    """
+
+    def __init__(self, anime_ids, bitmaps):
+        self.anime_ids = np.asarray(anime_ids, dtype=np.int32)
+        self.n = len(self.anime_ids)
+        # {facet: {value: packed uint8 bitmap}}
+        self.bitmaps = bitmaps
+
+    def positions(self, ids):
+        """Catalog position of each id, -1 for ids not in the catalog"""
+        ids = np.asarray(ids, dtype=np.int64)
+        if self.n == 0:
+            return np.full(len(ids), -1)
+        pos = np.minimum(np.searchsorted(self.anime_ids, ids), self.n - 1)
+        return np.where(self.anime_ids[pos] == ids, pos, -1)
+
+    def from_ids(self, ids):
+        mask = np.zeros(self.n, dtype=bool)
+        pos = self.positions(ids)
+        mask[pos[pos >= 0]] = True
+        return np.packbits(mask)
+
+    def to_mask(self, bitmap):
+        return np.unpackbits(bitmap, count=self.n).astype(bool)
+
+    def contains(self, mask, ids):
+        """Vectorized membership of ids in a boolean catalog mask (unknown ids -> False)"""
+        pos = self.positions(ids)
+        return (pos >= 0) & mask[np.maximum(pos, 0)]
+
+    def values(self, facet):
+        return sorted(self.bitmaps.get(facet, {}))
+
+    def facet(self, facet, values):
+        """OR of the bitmaps for the requested values of one facet"""
+        by_value = self.bitmaps.get(facet, {})
+        result = np.zeros((self.n + 7) // 8, dtype=np.uint8)
+        for value in values:
+            if value in by_value:
+                result |= by_value[value]
+        return result
+
+    def query(self, filters=None, exclude=None):
+        """
+        Boolean catalog mask for `filters` ({facet: [values]}, OR within a
+        facet, AND across facets) minus the `exclude` bitmap. Returns None
+        when nothing is filtered so callers can skip masking entirely.
+        """
+        filters = {f: v for f, v in (filters or {}).items() if v}
+        if not filters and exclude is None:
+            return None
+
+        bitmap = np.full((self.n + 7) // 8, 0xFF, dtype=np.uint8)
+        for facet in FACETS:
+            if facet in filters:
+                bitmap &= self.facet(facet, filters[facet])
+        if exclude is not None:
+            bitmap &= ~exclude
+
+        return self.to_mask(bitmap)
+
+
+def _bitmaps_by_value(index_ids, anime_ids, values):
+    """{value: packed bitmap} from parallel arrays of anime_id and facet value"""
+    frame = pd.DataFrame({"anime_id": anime_ids, "value": values}).dropna()
+    pos = np.searchsorted(index_ids, frame["anime_id"].to_numpy())
+    frame = frame.assign(pos=pos)
+    frame = frame[frame["pos"] < len(index_ids)]
+    frame = frame[index_ids[frame["pos"]] == frame["anime_id"].to_numpy()]
+
+    bitmaps = {}
+    for value, group in frame.groupby("value", sort=True):
+        mask = np.zeros(len(index_ids), dtype=bool)
+        mask[group["pos"].to_numpy()] = True
+        bitmaps[str(value)] = np.packbits(mask)
+    return bitmaps
+
+def build_bitmap_index(catalog, anime_genres, anime_studios):
+    """catalog: anime_id/type/rating/year rows from the anime table"""
+    anime_ids = np.sort(catalog["anime_id"].to_numpy(dtype=np.int32))
+    years = catalog["year"].map(lambda y: year_bucket(y) if pd.notna(y) else None)
+
+    bitmaps = {
+        "genre": _bitmaps_by_value(anime_ids, anime_genres["anime_id"], anime_genres["genre"]),
+        "studio": _bitmaps_by_value(anime_ids, anime_studios["anime_id"], anime_studios["studio"]),
+        "type": _bitmaps_by_value(anime_ids, catalog["anime_id"], catalog["type"]),
+        "rating": _bitmaps_by_value(anime_ids, catalog["anime_id"], catalog["rating"]),
+        "year": _bitmaps_by_value(anime_ids, catalog["anime_id"], years),
+    }
+    return BitmapIndex(anime_ids, bitmaps)
@@ -0,0 +1,154 @@
+"""
+Multi-source candidate generation under a latency budget.
+
+Everything that waits on the database (one user_ratings query giving each
+user's liked and seen sets, then content-neighbor expansion) runs as one
+stage on a bounded thread pool. Meanwhile the ALS product and catalog filter
+are computed inline on the request thread, so stalled queries can never
+starve them. The database stage has its own deadline (never later than the
+request budget); if it misses it, content candidates are dropped, and with
+exclude_seen the seen-set cannot be applied, which the report records as a
+dropped "seen" stage.
+"""
+import os
+import time
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+
+import numpy as np
+
+from .profiling import attach, current_profile
+
+# Latency budget for candidate generation per request (ms)
+BUDGET_MS = float(os.getenv("RECOMMEND_BUDGET_MS", "150"))
+
+# Deadline (ms) for the pooled database stage, capped by the request budget
+CONTENT_TIMEOUT_MS = float(os.getenv("CANDIDATES_CONTENT_TIMEOUT_MS", str(BUDGET_MS)))
+
+# Candidates taken from each source; merged in this order and deduplicated
+SOURCE_SIZES = {"als": 50, "content": 30, "popular": 20}
+COLD_START_SIZE = 50
+
+_executor = None
+
+
+def _get_executor():
+    # Created lazily so recommender instances stay picklable. Only the
+    # database-bound stage runs here.
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("CANDIDATES_WORKERS", "8")),
+            thread_name_prefix="candidates",
+        )
+    return _executor
+
+
+def als_scores(recommender, user_ids):
+    """Full ALS score rows for the warm users, from one user-factors x item-factors product: {position: scores}"""
+    factors = [recommender._get_user_factors(uid) for uid in user_ids]
+    warm = [i for i, f in enumerate(factors) if f is not None]
+    if not warm:
+        return {}
+    scores = np.vstack([factors[i] for i in warm]) @ recommender.cf_model.item_factors.T
+    return {i: scores[j] for j, i in enumerate(warm)}
+
+def content_neighbor_candidates(recommender, liked, mask, n):
+    """Anime appearing most often among the precomputed neighbors of the user's liked items"""
+    neighbors = recommender.cb_artifacts['neighbors']
+    counts = Counter(aid for liked_id in liked for aid in neighbors.get(liked_id, ()))
+    ids = np.array([aid for aid, _ in counts.most_common()], dtype=np.int64)
+    return recommender._masked(ids, mask, n).tolist()
+
+def _database_stage(recommender, user_ids, filters, exclude_seen, filter_mask, n, profile=None):
+    # One user_ratings query yields the liked items (content profile and
+    # neighbor seeds, reused for content scoring) and, with exclude_seen, the
+    # seen-sets folded into each user's catalog mask. `profile` is the
+    # request's active profile, if any, so this worker's SQL and stacks are
+    # recorded with it.
+    with attach(profile):
+        liked_by_user, seen_by_user = recommender._get_users_liked_and_seen(user_ids, include_seen=exclude_seen)
+        liked = [liked_by_user[int(uid)] for uid in user_ids]
+        if exclude_seen:
+            index = recommender.bitmap_index
+            masks = [index.query(filters, index.from_ids(seen_by_user[int(uid)])) for uid in user_ids]
+        else:
+            masks = [filter_mask] * len(user_ids)
+        content = [
+            content_neighbor_candidates(recommender, user_liked, mask, n)
+            for user_liked, mask in zip(liked, masks)
+        ]
+        return liked, masks, content
+
+
+def generate_candidates(recommender, user_ids, filters=None, exclude_seen=False, preferred_genres=None,
+                        budget_ms=None):
+    """
+    Candidates for several users under one budget: one ratings query and one
+    ALS product for the whole batch. Returns (candidates, sources, liked,
+    cf_scores, masks, reports), each a list with one entry per user except:
+      liked: None if the database stage was dropped
+      cf_scores: als_scores() rows, for reuse in scoring
+    with
+      candidates: merged, deduplicated anime_ids
+      sources: {anime_id: [source, ...]} for every candidate
+      masks: the catalog mask actually applied (filters, minus seen if known)
+      reports: {"contributed": [...], "dropped": [...], "elapsed_ms": float}
+    """
+    budget_ms = BUDGET_MS if budget_ms is None else budget_ms
+    start = time.perf_counter()
+    executor = _get_executor()
+
+    filter_mask = recommender.bitmap_index.query(filters)
+    stage = executor.submit(
+        _database_stage, recommender, user_ids, filters, exclude_seen, filter_mask,
+        SOURCE_SIZES["content"], current_profile()
+    )
+
+    cf_scores = als_scores(recommender, user_ids)
+
+    liked, content, dropped = None, None, []
+    masks = [filter_mask] * len(user_ids)
+    deadline = start + min(budget_ms, CONTENT_TIMEOUT_MS) / 1000.0
+    try:
+        liked, masks, content = stage.result(timeout=max(0.0, deadline - time.perf_counter()))
+    except FuturesTimeout:
+        stage.cancel()
+        dropped.append("content")
+    except Exception as e:
+        print(f"Candidate database stage failed: {e}")
+        dropped.append("content")
+    if liked is None and exclude_seen:
+        dropped.append("seen")
+
+    candidates_by_user, sources_by_user, contributed = [], [], []
+    for i, mask in enumerate(masks):
+        results = {}
+        if i in cf_scores:
+            results["als"] = recommender._cf_candidates(cf_scores[i], mask, SOURCE_SIZES["als"])
+            results["popular"] = recommender._cold_start_candidates(n=SOURCE_SIZES["popular"], mask=mask)
+        else:
+            results["popular"] = recommender._cold_start_candidates(preferred_genres, n=COLD_START_SIZE, mask=mask)
+        if content is not None:
+            results["content"] = content[i]
+
+        candidates, sources = [], {}
+        for name in ("als", "content", "popular"):
+            for aid in results.get(name, ()):
+                aid = int(aid)
+                if aid not in sources:
+                    sources[aid] = []
+                    candidates.append(aid)
+                sources[aid].append(name)
+
+        candidates_by_user.append(candidates)
+        sources_by_user.append(sources)
+        contributed.append([name for name in ("als", "content", "popular") if results.get(name)])
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    reports = [
+        {"contributed": names, "dropped": dropped, "elapsed_ms": elapsed_ms}
+        for names in contributed
+    ]
+    return candidates_by_user, sources_by_user, liked, cf_scores, masks, reports
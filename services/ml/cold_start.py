@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from .db import engine
+from .snapshot import USE_SNAPSHOTS, read_snapshot
+
+
+def load_anime_genres():
+    if USE_SNAPSHOTS:
+        return read_snapshot("anime_genres")
+    query = """
+        SELECT ag.anime_id, g.name AS genre
+        FROM anime_genres ag
+        JOIN genres g ON ag.genre_id = g.genre_id
+    """
+    return pd.read_sql(query, engine)
+
+def load_anime_studios():
+    if USE_SNAPSHOTS:
+        return read_snapshot("anime_studios")
+    query = """
+        SELECT ast.anime_id, s.name AS studio
+        FROM anime_studios ast
+        JOIN studios s ON ast.studio_id = s.studio_id
+    """
+    return pd.read_sql(query, engine)
+
+def popularity_order(anime_df):
+    """anime_ids sorted most popular first (MAL popularity is a rank, so ascending)."""
+    ordered = anime_df.sort_values("popularity", na_position="last", kind="stable")
+    return ordered["anime_id"].to_numpy(dtype=np.int32)
+
+def _grouped_rankings(links, key, position):
+    # Keep only anime the engine knows about, then order each group by global popularity
+    links = links[links["anime_id"].isin(position.index)]
+    links = links.assign(pos=links["anime_id"].map(position)).sort_values("pos", kind="stable")
+
+    return {
+        name: group["anime_id"].to_numpy(dtype=np.int32)
+        for name, group in links.groupby(key, sort=True)
+    }
+
+def build_cold_start_index(anime_df, anime_genres, anime_studios):
+    """
+    Popularity rankings used to serve users without CF factors.
+    Every list is an int32 array of anime_ids, most popular first.
+    """
+    popular = popularity_order(anime_df)
+    position = pd.Series(np.arange(len(popular)), index=popular)
+
+    return {
+        "popular": popular,
+        "by_genre": _grouped_rankings(anime_genres, "genre", position),
+        "by_studio": _grouped_rankings(anime_studios, "studio", position),
+    }
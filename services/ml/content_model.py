@@ -5,25 +5,63 @@ import joblib
 import os
 
 from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.decomposition import TruncatedSVD
 from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+from sqlalchemy import text
 
 from .db import engine
+from .hashed_tfidf import build_hashed_tfidf_matrix
+from .cold_start import load_anime_genres, load_anime_studios, build_cold_start_index
+from .bitmap_index import load_catalog, build_bitmap_index
+from .profiling import profile_from_env
+from .snapshot import USE_SNAPSHOTS, iter_snapshot, read_snapshot
 
-ARTIFACTS_PATH = "/app/services/ml/artifacts/" 
+ARTIFACTS_PATH = os.getenv("ML_ARTIFACTS_PATH", "/app/services/ml/artifacts/")
 MODEL_FILENAME = "content_model_artifacts.joblib"
 
+# Dimensionality of the LSA projection of the TF-IDF matrix
+LSA_COMPONENTS = int(os.getenv("CONTENT_LSA_COMPONENTS", "128"))
+# Content scoring engine: "sparse" (TF-IDF) or "dense" (LSA embeddings)
+CONTENT_MODE = os.getenv("CONTENT_MODE", "sparse")
+# Synopsis featurizer: "tfidf" (fitted vocabulary) or "hashing" (vocabulary-free, streamed)
+FEATURIZER = os.getenv("CONTENT_FEATURIZER", "tfidf")
+HASHING_FEATURES = int(os.getenv("CONTENT_HASHING_FEATURES", str(2 ** 18)))
+CHUNK_SIZE = int(os.getenv("CONTENT_CHUNK_SIZE", "2000"))
+
+ANIME_QUERY = """
+    SELECT
+        a.anime_id,
+        a.title,
+        a.synopsis,
+        a.rank,
+        a.popularity,
+        a.type
+    FROM anime a
+    WHERE a.synopsis IS NOT NULL
+"""
+
+ANIME_COLUMNS = ["anime_id", "title", "synopsis", "rank", "popularity", "type"]
+
 def load_anime():
-    query = """
-        SELECT
-            a.anime_id,
-            a.title,
-            a.synopsis,
-            a.rank,
-            a.popularity
-        FROM anime a
-        WHERE a.synopsis IS NOT NULL
+    if USE_SNAPSHOTS:
+        anime = read_snapshot("anime", columns=ANIME_COLUMNS)
+        return anime[anime["synopsis"].notna()].reset_index(drop=True)
+    return pd.read_sql(ANIME_QUERY, engine)
+
+def load_anime_chunks(chunksize=CHUNK_SIZE):
+    """
+    Stream anime rows in chunks: record batches of the snapshot, or with
+    USE_SNAPSHOTS=0 the anime query through a server-side cursor
     """
-    return pd.read_sql(query, engine)
+    if USE_SNAPSHOTS:
+        for chunk in iter_snapshot("anime", columns=ANIME_COLUMNS, batch_size=chunksize):
+            chunk = chunk[chunk["synopsis"].notna()]
+            if len(chunk):
+                yield chunk
+        return
+    with engine.connect().execution_options(stream_results=True) as conn:
+        yield from pd.read_sql(text(ANIME_QUERY), conn, chunksize=chunksize)
 
 def build_tfidf_matrix(anime_df):
     tfidf = TfidfVectorizer(
@@ -35,6 +73,14 @@ def build_tfidf_matrix(anime_df):
     X = tfidf.fit_transform(anime_df["synopsis"].fillna(""))
     return X, tfidf
 
+def build_lsa_embeddings(X, n_components=LSA_COMPONENTS):
+    """Project TF-IDF rows onto n_components LSA dims; rows are L2-normalized float32."""
+    n_components = min(n_components, X.shape[0] - 1, X.shape[1] - 1)
+    svd = TruncatedSVD(n_components=n_components, random_state=42)
+
+    embeddings = normalize(svd.fit_transform(X)).astype(np.float32)
+    return embeddings, svd
+
 def precompute_neighbors(anime, X, k=10):
     # sim = cosine_similarity(X)
     sim = cosine_similarity(X, dense_output=True)
@@ -49,15 +95,38 @@ def precompute_neighbors(anime, X, k=10):
 
     return neighbors
 
-def build_content_model():
-    anime = load_anime()
-    X, tfidf = build_tfidf_matrix(anime)
-    neighbors = precompute_neighbors(anime, X)
+def build_content_model(anime=None, anime_genres=None, anime_studios=None, catalog=None):
+    if FEATURIZER == "hashing":
+        if anime is None:
+            chunks = load_anime_chunks()
+        else:
+            chunks = (anime.iloc[i:i + CHUNK_SIZE] for i in range(0, len(anime), CHUNK_SIZE))
+        X, tfidf, anime = build_hashed_tfidf_matrix(chunks, n_features=HASHING_FEATURES)
+    else:
+        if anime is None:
+            anime = load_anime()
+        X, tfidf = build_tfidf_matrix(anime)
+
+    if catalog is None:
+        catalog = load_catalog()
+    if anime_genres is None:
+        anime_genres = load_anime_genres()
+    if anime_studios is None:
+        anime_studios = load_anime_studios()
+
+    embeddings, svd = build_lsa_embeddings(X)
+    neighbors = precompute_neighbors(anime, embeddings)
+    cold_start = build_cold_start_index(anime, anime_genres, anime_studios)
+    bitmap_index = build_bitmap_index(catalog, anime_genres, anime_studios)
 
     return {
         "anime_df": anime,
         "tfidf": tfidf,
+        "svd": svd,
+        "embeddings": embeddings,
         "neighbors": neighbors,
+        "cold_start": cold_start,
+        "bitmap_index": bitmap_index,
     }
 
 
@@ -75,7 +144,8 @@ def save_model(model_artifacts, path):
 if __name__ == "__main__":
     os.makedirs(ARTIFACTS_PATH, exist_ok=True)
     
-    model = build_content_model()
+    with profile_from_env("content_model"):
+        model = build_content_model()
     print(f"Built content model for {len(model['anime_df'])} anime")
     
     full_path = os.path.join(ARTIFACTS_PATH, MODEL_FILENAME)
@@ -8,8 +8,10 @@ from scipy.sparse import csr_matrix
 
 from .db import engine
 from . import hybrid_model
+from .snapshot import USE_SNAPSHOTS, read_snapshot
+from .profiling import profile_from_env
 
-ARTIFACTS_PATH = "/app/services/ml/artifacts/"
+ARTIFACTS_PATH = os.getenv("ML_ARTIFACTS_PATH", "/app/services/ml/artifacts/")
 CF_ARTIFACTS_PATH = os.path.join(ARTIFACTS_PATH, "als_model_artifacts.joblib")
 CB_ARTIFACTS_PATH = os.path.join(ARTIFACTS_PATH, "content_model_artifacts.joblib")
 HYBRID_ENGINE_PATH = os.path.join(ARTIFACTS_PATH, "hybrid_recommender_engine.joblib")
@@ -34,6 +36,8 @@ def load_artifacts():  # sourcery skip: use-contextlib-suppress
 
 
 def get_user_ratings():
+    if USE_SNAPSHOTS:
+        return read_snapshot("user_ratings", columns=["user_id", "anime_id", "rating"])
     query = "SELECT user_id, anime_id, rating FROM user_ratings ORDER BY user_id"
     return pd.read_sql(query, engine)
 
@@ -173,4 +177,5 @@ def run_evaluation(n_users: int = 100):
 
 
 if __name__ == '__main__':
-    run_evaluation()
\ No newline at end of file
+    with profile_from_env('evaluate'):
+        run_evaluation()
\ No newline at end of file
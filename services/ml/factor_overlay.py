@@ -0,0 +1,46 @@
+import numpy as np
+
+
+class RedisFactorOverlay:
+    """
+    Folded-in user factors kept in a Redis hash instead of a per-process dict,
+    so every worker (and shard) sees fold-ins made through any of them.
+    Supports the dict operations HybridRecommender uses on user_factor_overlay.
+
+    `namespace` should include the ALS model version: factors are solved
+    against one set of item factors and are meaningless for a retrained model.
+    """
+
+    def __init__(self, client, namespace, dtype=np.float32):
+        self.client = client
+        self.key = f"fold_in:{namespace}"
+        self.dtype = np.dtype(dtype)
+
+    def get(self, user_id, default=None):
+        raw = self.client.hget(self.key, int(user_id))
+        return default if raw is None else np.frombuffer(raw, dtype=self.dtype)
+
+    def __getitem__(self, user_id):
+        factors = self.get(user_id)
+        if factors is None:
+            raise KeyError(user_id)
+        return factors
+
+    def __setitem__(self, user_id, factors):
+        self.client.hset(self.key, int(user_id), np.asarray(factors, dtype=self.dtype).tobytes())
+
+    def update(self, factors_by_user):
+        mapping = {
+            int(u): np.asarray(f, dtype=self.dtype).tobytes() for u, f in factors_by_user.items()
+        }
+        if mapping:
+            self.client.hset(self.key, mapping=mapping)
+
+    def __contains__(self, user_id):
+        return bool(self.client.hexists(self.key, int(user_id)))
+
+    def __iter__(self):
+        return (int(u) for u in self.client.hkeys(self.key))
+
+    def __len__(self):
+        return self.client.hlen(self.key)
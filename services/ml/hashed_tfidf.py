@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from scipy.sparse import vstack
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+N_FEATURES = 2 ** 18
+
+
+class HashedTfidf:
+    """
+    Vocabulary-free TF-IDF: HashingVectorizer term counts reweighted by an
+    IDF vector computed in a streaming pass. The only fitted state is the
+    n_features idf array, so artifact size does not grow with vocabulary and
+    transform() needs no refit for new or changed synopses.
+    Mirrors TfidfVectorizer defaults (smooth idf, raw tf, l2 norm).
+    """
+
+    def __init__(self, n_features=N_FEATURES):
+        self.n_features = n_features
+        self.idf_ = None
+
+    def _vectorizer(self):
+        return HashingVectorizer(
+            n_features=self.n_features,
+            stop_words="english",
+            ngram_range=(1, 2),
+            alternate_sign=False,
+            norm=None,
+        )
+
+    def counts(self, texts):
+        X = self._vectorizer().transform(texts)
+        X.sum_duplicates()
+        return X
+
+    def fit_idf(self, doc_freq, n_docs):
+        self.idf_ = (np.log((1 + n_docs) / (1 + doc_freq)) + 1).astype(np.float32)
+        return self
+
+    def weight(self, counts):
+        return normalize(counts.multiply(self.idf_).tocsr())
+
+    def transform(self, texts):
+        return self.weight(self.counts(texts))
+
+
+def _hash_counts(n_features, texts):
+    # Module-level so worker processes can unpickle it
+    return HashedTfidf(n_features).counts(texts)
+
+def build_hashed_tfidf_matrix(chunks, n_features=N_FEATURES, n_jobs=None, max_in_flight=4):
+    """
+    Featurize an iterable of anime DataFrame chunks. Tokenization/hashing runs
+    in worker processes with at most `max_in_flight` chunks outstanding;
+    document frequencies accumulate as chunks complete.
+    Returns (X, featurizer, anime_df) with anime_df the concatenated chunks.
+    """
+    featurizer = HashedTfidf(n_features)
+    doc_freq = np.zeros(n_features, dtype=np.int64)
+    frames, blocks = [], []
+
+    def collect(future):
+        counts = future.result()
+        doc_freq[:] += np.bincount(counts.indices, minlength=n_features)
+        blocks.append(counts)
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        pending = deque()
+        for chunk in chunks:
+            frames.append(chunk)
+            pending.append(pool.submit(_hash_counts, n_features, chunk["synopsis"].fillna("").tolist()))
+            while len(pending) > max_in_flight:
+                collect(pending.popleft())
+        while pending:
+            collect(pending.popleft())
+
+    anime_df = pd.concat(frames, ignore_index=True)
+    featurizer.fit_idf(doc_freq, len(anime_df))
+
+    X = featurizer.weight(vstack(blocks).tocsr())
+    return X, featurizer, anime_df
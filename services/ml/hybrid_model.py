@@ -2,19 +2,23 @@ import numpy as np
 import pandas as pd
 from sklearn.preprocessing import MinMaxScaler
 from scipy.sparse import csr_matrix
-from sqlalchemy import text
+from sqlalchemy import text, bindparam
 
 from .db import engine
+from .als_model import fold_in_users
+from .content_model import CONTENT_MODE
+from .candidates import generate_candidates
 
 import joblib
 import os
 
 
-ARTIFACTS_PATH = "/app/services/ml/artifacts/" 
+ARTIFACTS_PATH = os.getenv("ML_ARTIFACTS_PATH", "/app/services/ml/artifacts/")
 MODEL_FILENAME = "hybrid_recommender_engine.joblib"
 
 CF_ARTIFACTS_PATH = os.path.join(ARTIFACTS_PATH, "als_model_artifacts.joblib")
 CB_ARTIFACTS_PATH = os.path.join(ARTIFACTS_PATH, "content_model_artifacts.joblib")
+SIMILAR_ARTIFACTS_PATH = os.path.join(ARTIFACTS_PATH, "similar_items_artifacts.joblib")
 
 class HybridRecommender:
     def __init__(self):
@@ -34,6 +38,11 @@ class HybridRecommender:
         self.item_map = self.cf_artifacts['anime_map']
         self.id_to_idx_cf = {v: k for k, v in self.item_map.items()}
 
+        # Factors for users folded in after training; consulted before user_map.
+        # A plain dict is private to this process: with several workers, swap in
+        # a shared store (factor_overlay.RedisFactorOverlay) so fold-ins reach all of them
+        self.user_factor_overlay = {}
+
         # 2. LOAD Content-Based Artifacts (DO NOT CALL build_content_model)
         try:
             self.cb_artifacts = joblib.load(CB_ARTIFACTS_PATH)
@@ -49,12 +58,35 @@ class HybridRecommender:
         print("Recomputing TF-IDF matrix for hybrid scoring...")
         self.tfidf_matrix = self.tfidf.transform(self.anime_df['synopsis'].fillna(""))
 
+        # Dense LSA embeddings (rows aligned with tfidf_matrix) for the "dense" content engine
+        self.item_embeddings = self.cb_artifacts['embeddings']
+        self.content_mode = CONTENT_MODE
+
         # Map anime_id to matrix row index
         self.anime_id_to_matrix_idx = {
             row.anime_id: idx 
             for idx, row in self.anime_df.iterrows()
         }
 
+        # 4. Cold-start rankings (precomputed by content_model.py)
+        self.cold_start = self.cb_artifacts['cold_start']
+        self.popularity_position = {
+            int(aid): pos for pos, aid in enumerate(self.cold_start['popular'])
+        }
+
+        # 5. Bitmap filter index over the catalog, and each ALS item's catalog position
+        self.bitmap_index = self.cb_artifacts['bitmap_index']
+        self.cf_catalog_pos = self.bitmap_index.positions(
+            [self.id_to_idx_cf[i] for i in range(len(self.id_to_idx_cf))]
+        )
+
+        # 6. Similar-items neighbor index (optional, built by similar_items.py)
+        try:
+            self.similar_index = joblib.load(SIMILAR_ARTIFACTS_PATH)
+        except FileNotFoundError:
+            print("Similar-items index not found; /similar will be unavailable.")
+            self.similar_index = None
+
     def quality_score(self, rank):
         """Signal 3.1: Inverse Rank (High rank = High quality)"""
         # Handle None or 0 ranks (unranked items)
@@ -92,12 +124,118 @@ class HybridRecommender:
             result = conn.execute(query, {"user_id": uid, "threshold": thr})
             return [row[0] for row in result]
 
-    def _calculate_content_scores(self, user_id, candidate_ids):
+    def _get_users_liked_and_seen(self, user_ids, threshold=7.0, include_seen=True):
+        """
+        Liked (rating >= threshold) and seen (any rating) anime for several
+        users from one user_ratings query: ({user_id: [...]}, {user_id: [...]}).
+        With include_seen=False only liked rows are fetched and seen is empty.
+        """
+        query = text(f"""
+            SELECT user_id, anime_id, rating
+            FROM user_ratings
+            WHERE user_id IN :user_ids {"" if include_seen else "AND rating >= :threshold"}
+        """).bindparams(bindparam("user_ids", expanding=True))
+        liked = {int(u): [] for u in user_ids}
+        seen = {int(u): [] for u in user_ids}
+        with engine.connect() as conn:
+            result = conn.execute(query, {"user_ids": list(liked), "threshold": float(threshold)})
+            for uid, aid, rating in result:
+                if include_seen:
+                    seen[int(uid)].append(aid)
+                if rating >= threshold:
+                    liked[int(uid)].append(aid)
+        return liked, seen
+
+    def _get_user_ratings(self, user_ids):
+        """Fetch (user_id, anime_id, rating) rows for the given users, from the same source ALS trains on"""
+        query = text("""
+            SELECT user_id, anime_id, rating
+            FROM user_ratings
+            WHERE user_id IN :user_ids AND source = 'synthetic'
+        """).bindparams(bindparam("user_ids", expanding=True))
+        with engine.connect() as conn:
+            result = conn.execute(query, {"user_ids": [int(u) for u in user_ids]})
+            return pd.DataFrame(result.fetchall(), columns=["user_id", "anime_id", "rating"])
+
+    def _get_user_factors(self, user_id):
+        """ALS factor vector for a user (folded-in overlay first), or None for cold start"""
+        factors = self.user_factor_overlay.get(user_id)
+        if factors is not None:
+            return factors
+        if user_id in self.user_map:
+            return self.cf_model.user_factors[self.user_map[user_id]]
+        return None
+
+    def fold_in_many(self, user_ids, ratings=None):
+        """
+        Compute ALS factors for new or updated users against the fixed item
+        factors and store them in the overlay. `ratings` is a DataFrame of
+        user_id/anime_id/rating; fetched from user_ratings if omitted.
+        Returns the user_ids that received factors.
+        """
+        user_ids = list(dict.fromkeys(int(u) for u in user_ids))
+        if ratings is None:
+            ratings = self._get_user_ratings(user_ids)
+
+        ratings = ratings[ratings['anime_id'].isin(self.item_map.keys())]
+        rated = set(ratings['user_id'].tolist())
+        folded = [u for u in user_ids if u in rated]
+        if not folded:
+            return []
+
+        row_of = {u: i for i, u in enumerate(folded)}
+        ratings = ratings[ratings['user_id'].isin(row_of.keys())]
+        user_items = csr_matrix(
+            (
+                ratings['rating'].to_numpy(dtype=np.float64) / 10.0,
+                (ratings['user_id'].map(row_of), ratings['anime_id'].map(self.item_map))
+            ),
+            shape=(len(folded), len(self.item_map))
+        )
+
+        factors = fold_in_users(
+            self.cf_model.item_factors,
+            user_items,
+            regularization=self.cf_model.regularization,
+            alpha=getattr(self.cf_model, 'alpha', 1.0)
+        )
+        self.user_factor_overlay.update(zip(folded, factors))
+
+        return folded
+
+    def fold_in(self, user_id, ratings=None):
+        """fold_in_many for a single user; `ratings` may be an {anime_id: rating} dict"""
+        if isinstance(ratings, dict):
+            ratings = pd.DataFrame({
+                'user_id': int(user_id),
+                'anime_id': list(ratings.keys()),
+                'rating': list(ratings.values())
+            })
+        return bool(self.fold_in_many([user_id], ratings))
+
+    def _content_similarity(self, liked_indices, candidate_indices):
+        """Profile-vs-candidate similarity in the configured content space"""
+        if self.content_mode == 'dense':
+            # Small dense matmul over LSA embeddings (rows are L2-normalized)
+            user_profile_vec = self.item_embeddings[liked_indices].mean(axis=0)
+            return self.item_embeddings[candidate_indices] @ user_profile_vec
+
+        # Calculate centroid (average vector) of user's liked items
+        user_profile_vec = np.mean(self.tfidf_matrix[liked_indices], axis=0)
+        # Convert to numpy array if it's a matrix
+        user_profile_vec = np.asarray(user_profile_vec).reshape(1, -1)
+
+        candidate_matrix = self.tfidf_matrix[candidate_indices]
+        # Cosine similarity (dot product since vectors are normalized by TfidfVectorizer)
+        return (user_profile_vec @ candidate_matrix.T).flatten()
+
+    def _calculate_content_scores(self, user_id, candidate_ids, liked_items=None):
         """
         Content Score = Cosine Similarity(User Profile Vector, Candidate Item Vector)
-        User Profile Vector = Average of TF-IDF vectors of items the user liked.
+        User Profile Vector = Average of the TF-IDF (or LSA) vectors of items the user liked.
         """
-        liked_items = self._get_user_liked_anime(user_id)
+        if liked_items is None:
+            liked_items = self._get_user_liked_anime(user_id)
         
         if not liked_items:
             # Cold start fallback: return 0.0 scores or popularity
@@ -113,11 +251,6 @@ class HybridRecommender:
         if not liked_indices:
             return {aid: 0.0 for aid in candidate_ids}
 
-        # Calculate centroid (average vector) of user's liked items
-        user_profile_vec = np.mean(self.tfidf_matrix[liked_indices], axis=0)
-        # Convert to numpy array if it's a matrix
-        user_profile_vec = np.asarray(user_profile_vec).reshape(1, -1)
-
         # 2. Score Candidates
         scores = {}
         candidate_indices = []
@@ -131,10 +264,8 @@ class HybridRecommender:
                 scores[aid] = 0.0
 
         if candidate_indices:
-            candidate_matrix = self.tfidf_matrix[candidate_indices]
-            # Cosine similarity (dot product since vectors are normalized by TfidfVectorizer)
-            sim_scores = (user_profile_vec @ candidate_matrix.T).flatten()
-            
+            sim_scores = self._content_similarity(liked_indices, candidate_indices)
+
             for aid, score in zip(valid_candidate_ids, sim_scores):
                 scores[aid] = float(score)
 
@@ -144,11 +275,9 @@ class HybridRecommender:
         """
         CF Score = Dot Product(User Factor, Item Factor) from ALS model
         """
-        if user_id not in self.user_map:
+        user_factors = self._get_user_factors(user_id)
+        if user_factors is None:
             return {aid: 0.0 for aid in candidate_ids}
-
-        user_idx = self.user_map[user_id]
-        user_factors = self.cf_model.user_factors[user_idx]
         
         scores = {}
         for aid in candidate_ids:
@@ -163,116 +292,279 @@ class HybridRecommender:
         
         return scores
 
-    def recommend(self, user_id, alpha=0.6, beta=0.25, gamma=0.15, limit=20):
-        # 1. Generate Candidates (CF + Popular fallback)
-        if user_id in self.user_map:
-            user_idx = self.user_map[user_id]
-            # Compute top-N candidates from factor dot-product to avoid passing
-            # a full user_items matrix to implicit.recommend (which expects
-            # a CSR shaped to the number of requested users).
-            try:
-                user_factors = self.cf_model.user_factors[user_idx]
-                item_factors = self.cf_model.item_factors
-                scores = item_factors @ user_factors
-                top_idxs = np.argsort(-scores)[:50]
-                candidates = [self.id_to_idx_cf[int(i)] for i in top_idxs]
-            except Exception:
-                # Fallback: use popular items
-                candidates = self.anime_df.sort_values('popularity').head(50)['anime_id'].tolist()
-        else:
-            # Cold start: Use generic popular items
-            candidates = self.anime_df.sort_values('popularity').head(50)['anime_id'].tolist()
+    def similar(self, anime_id, limit=10, genre=None, anime_type=None):
+        """
+        Item-to-item neighbors from the precomputed index, optionally
+        restricted to a genre and/or anime type. Raises KeyError for unknown anime.
+        """
+        index = self.similar_index
+        if index is None:
+            raise RuntimeError("Similar-items index not built. Run similar_items.py first.")
+
+        anime_ids = index['anime_ids']
+        row = np.searchsorted(anime_ids, anime_id)
+        if row >= len(anime_ids) or anime_ids[row] != anime_id:
+            raise KeyError(anime_id)
+
+        neighbors = index['neighbor_ids'][row]
+        scores = index['neighbor_scores'][row]
+
+        keep = np.ones(len(neighbors), dtype=bool)
+        if genre is not None:
+            genre_ids = self.cold_start['by_genre'].get(genre, np.empty(0, dtype=np.int32))
+            keep &= np.isin(neighbors, genre_ids)
+        if anime_type is not None:
+            keep &= index['anime_types'][np.searchsorted(anime_ids, neighbors)] == anime_type
+
+        neighbors = neighbors[keep][:limit]
+        scores = scores[keep][:limit]
+        titles = index['titles'][np.searchsorted(anime_ids, neighbors)]
+
+        return [
+            {"anime_id": int(aid), "title": title, "score": float(score)}
+            for aid, title, score in zip(neighbors, titles, scores)
+        ]
 
-        # 2. Compute Component Scores
-        cf_scores_map = self._calculate_cf_scores(user_id, candidates)
-        cb_scores_map = self._calculate_content_scores(user_id, candidates)
+    def _masked(self, ids, mask, n=None):
+        """First n ids (in order) allowed by a catalog mask"""
+        if mask is not None:
+            ids = ids[self.bitmap_index.contains(mask, ids)]
+        return ids[:n]
 
-        # 3. Normalize Component Scores (MinMax)
-        # We need these normalized before plugging into your weighted sum
-        def normalize(score_map):
-            if not score_map: return {}
-            values = list(score_map.values())
-            min_v, max_v = min(values), max(values)
-            if max_v == min_v: return {k: 0.5 for k in score_map}
-            return {k: (v - min_v) / (max_v - min_v) for k, v in score_map.items()}
+    def _cold_start_candidates(self, preferred_genres=None, n=50, mask=None):
+        """
+        Popular items for users without CF factors. If the user picked genres
+        at onboarding, merge the head of each genre list by global popularity.
+        """
+        if preferred_genres:
+            by_genre = self.cold_start['by_genre']
+            lists = [self._masked(by_genre[g], mask, n) for g in preferred_genres if g in by_genre]
+            if lists:
+                merged = np.unique(np.concatenate(lists)).tolist()
+                merged.sort(key=self.popularity_position.__getitem__)
+                return merged[:n]
+
+        return self._masked(self.cold_start['popular'], mask, n).tolist()
+
+    def _cf_candidates(self, scores, mask, n=50):
+        """Top-n anime_ids from a full ALS score vector, restricted to the catalog mask"""
+        if mask is not None:
+            allowed = (self.cf_catalog_pos >= 0) & mask[np.maximum(self.cf_catalog_pos, 0)]
+            scores = np.where(allowed, scores, -np.inf)
+            top_idxs = np.argsort(-scores)[:min(n, int(allowed.sum()))]
+        else:
+            top_idxs = np.argsort(-scores)[:n]
+        return [self.id_to_idx_cf[int(i)] for i in top_idxs]
 
-        cf_norm = normalize(cf_scores_map)
-        cb_norm = normalize(cb_scores_map)
+    def recommend(self, user_id, alpha=0.6, beta=0.25, gamma=0.15, limit=20, preferred_genres=None,
+                  filters=None, exclude_seen=False, budget_ms=None):
+        """
+        filters: {facet: [values]} over genre/studio/type/rating/year (OR within
+        a facet, AND across facets); exclude_seen drops anime the user rated.
+        Both are applied as a catalog mask before top-k candidate selection.
+        """
+        return self.recommend_with_report(
+            user_id, alpha, beta, gamma, limit, preferred_genres, filters, exclude_seen, budget_ms
+        )[0]
 
-        # 4. Final Scoring & Re-ranking (Section 3.3)
-        scored_candidates = []
-        
-        for aid in candidates:
-            # Fetch Metadata; skip candidate if metadata not available
-            meta_df = self.anime_df[self.anime_df['anime_id'] == aid]
-            if meta_df.empty:
+    def recommend_with_report(self, user_id, alpha=0.6, beta=0.25, gamma=0.15, limit=20, preferred_genres=None,
+                              filters=None, exclude_seen=False, budget_ms=None):
+        """
+        recommend() plus the candidate-generation report: which sources
+        contributed and which missed their deadline within `budget_ms`.
+        A batch of one, so single and batched requests rank identically.
+        """
+        return self.recommend_batch_with_report(
+            [user_id], alpha, beta, gamma, limit, preferred_genres, filters, exclude_seen, budget_ms
+        )[0]
+
+    def _content_scores_batch(self, liked_by_user, candidates_by_user):
+        """
+        _calculate_content_scores for many users with one product: user profiles
+        are rows of (averaging matrix @ item vectors), scored against the union
+        of all candidates at once.
+        """
+        space = self.item_embeddings if self.content_mode == 'dense' else self.tfidf_matrix
+        idx = self.anime_id_to_matrix_idx
+
+        rows, cols, weights = [], [], []
+        for row, liked in enumerate(liked_by_user):
+            liked_indices = [idx[aid] for aid in liked if aid in idx]
+            if not liked_indices:
+                # No profile: has_profile below scores this user's candidates 0.0
                 continue
-            meta = meta_df.iloc[0]
-            rank = meta.get('rank', None) if hasattr(meta, 'get') else meta['rank']
-            popularity = meta.get('popularity', None) if hasattr(meta, 'get') else meta['popularity']
-
-            # Get normalized component scores
-            s_content = cb_norm.get(aid, 0.0)
-            s_cf = cf_norm.get(aid, 0.0)
-
-            # Calculate Raw Hybrid Score (Reward)
-            raw_score = self.hybrid_score(s_content, s_cf, rank, alpha, beta, gamma)
-
-            # Apply Exposure Penalty (Optional: You can subtract it or use it as a post-filter)
-            # "Popularity is used... to avoid over-recommending blockbusters"
-            # Here we apply it as a dampener to the final score
-            penalty = self.exposure_penalty(popularity)
-            
-            # Example: Dampen highly popular items slightly to allow discovery
-            # (Adjust logic based on how aggressive you want the penalty to be)
-            final_score = raw_score * (1.0 + penalty) 
-
-            scored_candidates.append({
-                "anime_id": int(aid),
-                "title": meta['title'],
-                "final_score": final_score,
-                "metrics": {
-                    "content": s_content,
-                    "collaborative": s_cf,
-                    "quality_rank": self.quality_score(rank),
-                    "exposure_penalty": penalty
-                }
+            rows += [row] * len(liked_indices)
+            cols += liked_indices
+            weights += [1.0 / len(liked_indices)] * len(liked_indices)
+
+        union = sorted({idx[aid] for cands in candidates_by_user for aid in cands if aid in idx})
+        if not cols or not union:
+            return [{aid: 0.0 for aid in cands} for cands in candidates_by_user]
+
+        averaging = csr_matrix((weights, (rows, cols)), shape=(len(liked_by_user), space.shape[0]))
+        profiles = averaging @ space
+        sims = profiles @ space[union].T
+        sims = sims.toarray() if hasattr(sims, 'toarray') else np.asarray(sims)
+
+        col_of = {matrix_idx: j for j, matrix_idx in enumerate(union)}
+        has_profile = np.diff(averaging.indptr) > 0
+
+        return [
+            {
+                aid: float(sims[row, col_of[idx[aid]]]) if has_profile[row] and aid in idx else 0.0
+                for aid in cands
+            }
+            for row, cands in enumerate(candidates_by_user)
+        ]
+
+    def recommend_batch(self, user_ids, alpha=0.6, beta=0.25, gamma=0.15, limit=20, preferred_genres=None,
+                        filters=None, exclude_seen=False, budget_ms=None):
+        """
+        recommend() for several users sharing the same parameters. CF scores come
+        from one user-factors x item-factors product and content scores from one
+        profile x candidate product. Returns one result list per user_id.
+        """
+        return [
+            results for results, _ in self.recommend_batch_with_report(
+                user_ids, alpha, beta, gamma, limit, preferred_genres, filters, exclude_seen, budget_ms
+            )
+        ]
+
+    def recommend_batch_with_report(self, user_ids, alpha=0.6, beta=0.25, gamma=0.15, limit=20,
+                                    preferred_genres=None, filters=None, exclude_seen=False, budget_ms=None):
+        """
+        recommend_batch() with multi-source candidates (ALS + content neighbors
+        + popular) generated for the whole batch under one `budget_ms`; the
+        seen-set for exclude_seen is fetched inside that budget too.
+        Returns one (results, report) pair per user_id.
+        """
+        # 1. Candidates for every user at once (one ALS product, one ratings query)
+        candidates_by_user, sources_by_user, liked, cf_rows, masks, reports = generate_candidates(
+            self, user_ids, filters, exclude_seen, preferred_genres, budget_ms
+        )
+
+        # 2. CF scores from the same product, content scores from one more
+        cf_maps = []
+        for i, candidates in enumerate(candidates_by_user):
+            row = cf_rows.get(i)
+            cf_maps.append({
+                aid: float(row[self.item_map[aid]]) if row is not None and aid in self.item_map else 0.0
+                for aid in candidates
             })
+        cb_maps = self._content_scores_batch(
+            liked if liked is not None else [[] for _ in user_ids], candidates_by_user
+        )
+
+        batch_results = []
+        for cands, sources, cf_map, cb_map, mask, report in zip(
+            candidates_by_user, sources_by_user, cf_maps, cb_maps, masks, reports
+        ):
+            results = self._rank_candidates(cands, cf_map, cb_map, alpha, beta, gamma, limit, mask)
+            for r in results:
+                r['sources'] = sources.get(r['anime_id'], ['padding'])
+            batch_results.append((results, report))
+
+        return batch_results
 
-        # Sort descending by final score
-        scored_candidates.sort(key=lambda x: x['final_score'], reverse=True)
+    def _ranking_metadata(self):
+        """
+        anime_id-sorted arrays of what ranking reads per candidate (title and
+        the precomputed quality/exposure signals). Built on first use so
+        engines pickled before these arrays existed still load.
+        """
+        meta = getattr(self, '_ranking_meta', None)
+        if meta is None:
+            df = self.anime_df.drop_duplicates('anime_id').sort_values('anime_id', kind='stable')
+            rank = pd.to_numeric(df['rank'], errors='coerce').to_numpy(dtype=np.float64)
+            popularity = pd.to_numeric(df['popularity'], errors='coerce').to_numpy(dtype=np.float64)
+            # Vectorized quality_score / exposure_penalty (missing or non-positive -> 0.0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                quality = np.where(rank > 0, 1.0 / (rank + 1), 0.0)
+                penalty = np.where(popularity > 0, 1.0 / (popularity + 1), 0.0)
+            meta = {
+                'anime_ids': df['anime_id'].to_numpy(dtype=np.int64),
+                'titles': df['title'].to_numpy(dtype=object),
+                'quality': quality,
+                'penalty': penalty,
+            }
+            self._ranking_meta = meta
+        return meta
+
+    def _metadata_rows(self, ids):
+        """Row of each id in the ranking metadata, and whether it has metadata at all"""
+        meta_ids = self._ranking_metadata()['anime_ids']
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(meta_ids) == 0:
+            return np.zeros(len(ids), dtype=np.int64), np.zeros(len(ids), dtype=bool)
+        rows = np.minimum(np.searchsorted(meta_ids, ids), len(meta_ids) - 1)
+        return rows, meta_ids[rows] == ids
+
+    def _rank_candidates(self, candidates, cf_scores_map, cb_scores_map, alpha, beta, gamma, limit, mask):
+        """Normalize, blend and re-rank one user's candidates, padding to `limit`"""
+        meta = self._ranking_metadata()
+        ids = np.asarray(candidates, dtype=np.int64)
+
+        # 3. Normalize Component Scores (MinMax over all candidates)
+        def normalize(score_map):
+            values = np.array([score_map.get(aid, 0.0) for aid in candidates], dtype=np.float64)
+            if not score_map or len(values) == 0:
+                return np.zeros(len(values))
+            all_values = np.fromiter(score_map.values(), dtype=np.float64)
+            min_v, max_v = all_values.min(), all_values.max()
+            if max_v == min_v:
+                return np.where([aid in score_map for aid in candidates], 0.5, 0.0)
+            return (values - min_v) / (max_v - min_v)
+
+        s_cf = normalize(cf_scores_map)
+        s_content = normalize(cb_scores_map)
+
+        # 4. Final Scoring & Re-ranking (Section 3.3); candidates without
+        # metadata are skipped. Same formula as hybrid_score / exposure_penalty:
+        # raw = alpha * content + beta * cf + gamma * quality, dampened by popularity
+        rows, found = self._metadata_rows(ids)
+        ids, rows, s_cf, s_content = ids[found], rows[found], s_cf[found], s_content[found]
+        quality = meta['quality'][rows]
+        penalty = meta['penalty'][rows]
+        final = (alpha * s_content + beta * s_cf + gamma * quality) * (1.0 + penalty)
+
+        # Sort descending by final score (stable, so ties keep candidate order)
+        top = np.argsort(-final, kind='stable')[:limit]
+        scored_candidates = [
+            {
+                "anime_id": int(ids[i]),
+                "title": meta['titles'][rows[i]],
+                "final_score": float(final[i]),
+                "metrics": {
+                    "content": float(s_content[i]),
+                    "collaborative": float(s_cf[i]),
+                    "quality_rank": float(quality[i]),
+                    "exposure_penalty": float(penalty[i])
+                }
+            }
+            for i in top
+        ]
 
         # If we have fewer than `limit` candidates (due to missing metadata),
-        # pad with top popular items from the content DB that are not already included.
+        # pad with top popular items that are not already included.
         if len(scored_candidates) < limit:
-            existing = {c['anime_id'] for c in scored_candidates}
-            popular_candidates = (
-                self.anime_df.sort_values('popularity', ascending=False)['anime_id']
-                .tolist()
-            )
-            for aid in popular_candidates:
-                if len(scored_candidates) >= limit:
-                    break
-                if aid in existing:
-                    continue
-                meta_df = self.anime_df[self.anime_df['anime_id'] == aid]
-                if meta_df.empty:
-                    continue
-                meta = meta_df.iloc[0]
+            popular = self._masked(self.cold_start['popular'], mask).astype(np.int64)
+            popular = popular[~np.isin(popular, ids)]
+            pad_rows, pad_found = self._metadata_rows(popular)
+            for aid, row in zip(popular[pad_found][:limit - len(scored_candidates)], pad_rows[pad_found]):
                 scored_candidates.append({
                     'anime_id': int(aid),
-                    'title': meta['title'],
+                    'title': meta['titles'][row],
                     'final_score': 0.0,
                     'metrics': {
                         'content': 0.0,
                         'collaborative': 0.0,
-                        'quality_rank': self.quality_score(meta.get('rank', None)),
-                        'exposure_penalty': self.exposure_penalty(meta.get('popularity', None))
+                        'quality_rank': float(meta['quality'][row]),
+                        'exposure_penalty': float(meta['penalty'][row])
                     }
                 })
 
-        return scored_candidates[:limit]
-    
+        return scored_candidates
+
 
 def save_hybrid_engine(engine_instance, path):
     """Saves the initialized HybridRecommender instance."""
@@ -282,12 +574,11 @@ def save_hybrid_engine(engine_instance, path):
     except Exception as e:
         print(f"Error saving hybrid engine: {e}")
 
-# Note: The singleton instance below is what the API would typically load.
-# We are saving this instance.
-recommender_engine = HybridRecommender()
-
 if __name__ == "__main__":
-    # If this script is run directly, it will build the engine (above) and save it.
+    # If this script is run directly, build the engine and save it.
+    # (Not built at import time: unpickling an engine, e.g. in a shard
+    # process, must not load a second full copy from the artifacts.)
+    recommender_engine = HybridRecommender()
     os.makedirs(ARTIFACTS_PATH, exist_ok=True)
     
     # Save the initialized instance
@@ -0,0 +1,202 @@
+"""
+Content-addressed ML pipeline runner.
+
+Each step's cache key hashes its source files, the environment parameters it
+reads, fingerprints of the tables it loads and the keys of its upstream steps.
+Steps whose key matches the manifest (and whose outputs exist) are skipped;
+independent steps run in parallel.
+
+    python -m services.ml.pipeline [--dry-run] [--force STEP ...] [--jobs N]
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .snapshot import table_fingerprint
+
+ARTIFACTS_PATH = os.getenv("ML_ARTIFACTS_PATH", "/app/services/ml/artifacts/")
+MANIFEST_PATH = os.path.join(ARTIFACTS_PATH, "pipeline_manifest.json")
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STEPS = {
+    "synthetic_cf": {
+        "module": "services.ml.synthetic_cf",
+        "sources": ["synthetic_cf.py", "snapshot.py"],
+        "tables": ["anime", "anime_genres", "genres"],
+        "env": [],
+        "deps": [],
+        "outputs": [],
+        "writes": ["users", "user_ratings"],
+    },
+    "content_model": {
+        "module": "services.ml.content_model",
+        "sources": ["content_model.py", "cold_start.py", "bitmap_index.py", "hashed_tfidf.py", "snapshot.py"],
+        "tables": ["anime", "anime_genres", "genres", "anime_studios", "studios"],
+        "env": ["CONTENT_LSA_COMPONENTS", "CONTENT_FEATURIZER", "CONTENT_HASHING_FEATURES"],
+        "deps": [],
+        "outputs": ["content_model_artifacts.joblib"],
+        "writes": [],
+    },
+    "als_model": {
+        "module": "services.ml.als_model",
+        "sources": ["als_model.py", "snapshot.py"],
+        "tables": ["user_ratings"],
+        "env": ["ALS_WARM_START", "ALS_TOLERANCE"],
+        "deps": ["synthetic_cf"],
+        "outputs": ["als_model_artifacts.joblib"],
+        "writes": [],
+    },
+    "similar_items": {
+        "module": "services.ml.similar_items",
+        "sources": ["similar_items.py", "content_model.py"],
+        "tables": [],
+        "env": ["SIMILAR_ITEMS_K", "SIMILAR_ITEMS_CONTENT_WEIGHT", "CONTENT_MODE"],
+        "deps": ["content_model", "als_model"],
+        "outputs": ["similar_items_artifacts.joblib"],
+        "writes": [],
+    },
+    "hybrid_model": {
+        "module": "services.ml.hybrid_model",
+        "sources": ["hybrid_model.py", "als_model.py", "content_model.py"],
+        "tables": [],
+        "env": ["CONTENT_MODE"],
+        "deps": ["content_model", "als_model", "similar_items"],
+        "outputs": ["hybrid_recommender_engine.joblib"],
+        "writes": [],
+    },
+}
+
+
+def source_hash(sources):
+    digest = hashlib.sha256()
+    for filename in sources:
+        with open(os.path.join(ML_DIR, filename), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def step_key(name, upstream_keys, fingerprints):
+    step = STEPS[name]
+    payload = {
+        "step": name,
+        "source": source_hash(step["sources"]),
+        "env": {var: os.getenv(var) for var in step["env"]},
+        "tables": {t: fingerprints[t] for t in step["tables"]},
+        "deps": {d: upstream_keys[d] for d in step["deps"]},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_manifest(manifest):
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+def is_cached(name, key, manifest):
+    outputs = [os.path.join(ARTIFACTS_PATH, o) for o in STEPS[name]["outputs"]]
+    return manifest.get(name, {}).get("key") == key and all(os.path.exists(o) for o in outputs)
+
+
+def run_step(name, fingerprints):
+    # Hand down the fingerprints already computed here so the step's snapshot
+    # reads don't rescan the same tables
+    env = dict(os.environ, SNAPSHOT_FINGERPRINTS=json.dumps(fingerprints))
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-m", STEPS[name]["module"]], check=True, env=env)
+    return time.perf_counter() - start
+
+
+def run_pipeline(force=(), dry_run=False, jobs=2):
+    os.makedirs(ARTIFACTS_PATH, exist_ok=True)
+    manifest = load_manifest()
+
+    fingerprints = {}
+    keys = {}
+    done = set()
+    running = {}
+    failed = None
+
+    def fingerprints_for(name):
+        for table in STEPS[name]["tables"]:
+            if table not in fingerprints:
+                fingerprints[table] = table_fingerprint(table, refresh=True)
+        return fingerprints
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while len(done) < len(STEPS) and failed is None:
+            ready = [
+                name for name, step in STEPS.items()
+                if name not in done and name not in running.values()
+                and all(d in done for d in step["deps"])
+            ]
+
+            for name in ready:
+                keys[name] = step_key(name, keys, fingerprints_for(name))
+                if name not in force and is_cached(name, keys[name], manifest):
+                    print(f"[pipeline] {name}: cached, skipping")
+                    done.add(name)
+                elif dry_run:
+                    print(f"[pipeline] {name}: would run")
+                    done.add(name)
+                else:
+                    print(f"[pipeline] {name}: running")
+                    step_fingerprints = {t: fingerprints[t] for t in STEPS[name]["tables"]}
+                    running[pool.submit(run_step, name, step_fingerprints)] = name
+
+            if not running:
+                continue
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                try:
+                    seconds = future.result()
+                except subprocess.CalledProcessError as e:
+                    print(f"[pipeline] {name}: failed with exit code {e.returncode}")
+                    failed = name
+                    continue
+
+                print(f"[pipeline] {name}: finished in {seconds:.1f}s")
+                manifest[name] = {"key": keys[name], "seconds": round(seconds, 2), "finished_at": time.time()}
+                save_manifest(manifest)
+                done.add(name)
+
+                # Tables this step wrote must be fingerprinted again for downstream steps
+                for table in STEPS[name]["writes"]:
+                    fingerprints.pop(table, None)
+
+        # Let in-flight steps finish so their results are recorded
+        for future, name in list(running.items()):
+            try:
+                future.result()
+            except subprocess.CalledProcessError:
+                continue
+            manifest[name] = {"key": keys[name], "finished_at": time.time()}
+            save_manifest(manifest)
+
+    if failed is not None:
+        raise SystemExit(f"Pipeline failed at step {failed}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the ML training pipeline with cached steps")
+    parser.add_argument("--force", nargs="*", default=[], choices=list(STEPS), help="steps to rerun even if cached")
+    parser.add_argument("--dry-run", action="store_true", help="report which steps would run")
+    parser.add_argument("--jobs", type=int, default=2, help="max steps to run in parallel")
+    args = parser.parse_args()
+
+    run_pipeline(force=set(args.force), dry_run=args.dry_run, jobs=args.jobs)
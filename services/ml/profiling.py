@@ -0,0 +1,203 @@
+"""
+Opt-in sampling profiler for the recommendation path and ML scripts.
+
+A profile samples the calling thread's stack at a fixed interval and records
+the SQL that thread issues. Stacks are kept in folded form
+("outer;inner;leaf count"), which flamegraph.pl and speedscope read directly.
+"""
+import itertools
+import os
+import sys
+import threading
+import time
+
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_current = threading.local()
+_profile_ids = itertools.count(1)
+
+
+def fold_stack(frame):
+    """Root-first 'file:function' frames joined by ';'"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class RequestProfile:
+    def __init__(self, label):
+        self.profile_id = next(_profile_ids)
+        self.label = label
+        self.started_at = time.time()
+        self.duration_ms = None
+        self.samples = Counter()
+        # (statement, duration_ms)
+        self.sql = []
+        # Threads currently working for this profile (request thread plus any attached workers)
+        self.thread_ids = set()
+
+    def to_folded(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+    def summary(self):
+        return {
+            "profile_id": self.profile_id,
+            "label": self.label,
+            "started_at": self.started_at,
+            "duration_ms": self.duration_ms,
+            "num_samples": sum(self.samples.values()),
+            "num_queries": len(self.sql),
+            "sql_ms": sum(ms for _, ms in self.sql),
+        }
+
+    def to_dict(self):
+        return {
+            **self.summary(),
+            "sql": [{"statement": statement, "duration_ms": ms} for statement, ms in self.sql],
+            "folded": self.to_folded(),
+        }
+
+
+class StackSampler:
+    """
+    Background thread that samples the stacks of the target threads every
+    `interval` seconds. `thread_ids` is read live, so threads may be added
+    and removed while sampling.
+    """
+
+    def __init__(self, thread_ids, samples, interval=0.001):
+        self.thread_ids = thread_ids
+        self.samples = samples
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self.thread_ids):
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.samples[fold_stack(frame)] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class ProfileStore:
+    """Thread-safe ring buffer of the most recent profiles"""
+
+    def __init__(self, maxlen=50):
+        self._profiles = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def add(self, profile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def list(self):
+        with self._lock:
+            return [p.summary() for p in reversed(self._profiles)]
+
+    def get(self, profile_id):
+        with self._lock:
+            for p in self._profiles:
+                if p.profile_id == profile_id:
+                    return p
+        return None
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_current, "profile", None) is not None:
+        conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = getattr(_current, "profile", None)
+    starts = conn.info.get("profile_query_start")
+    if profile is not None and starts:
+        profile.sql.append((statement.strip(), (time.perf_counter() - starts.pop()) * 1000))
+
+
+@contextmanager
+def profile(label, interval=0.001, store=None):
+    """Sample the current thread and capture its SQL for the duration of the block"""
+    current = RequestProfile(label)
+    current.thread_ids.add(threading.get_ident())
+    sampler = StackSampler(current.thread_ids, current.samples, interval)
+
+    _current.profile = current
+    start = time.perf_counter()
+    sampler.start()
+    try:
+        yield current
+    finally:
+        sampler.stop()
+        current.duration_ms = (time.perf_counter() - start) * 1000
+        _current.profile = None
+        current.thread_ids.discard(threading.get_ident())
+        if store is not None:
+            store.add(current)
+
+def current_profile():
+    """The profile the calling thread is recording into, or None"""
+    return getattr(_current, "profile", None)
+
+@contextmanager
+def attach(current):
+    """
+    Record the calling thread's SQL and stacks into `current`, a profile
+    started on another thread. Used by pool workers doing part of a profiled
+    request; a no-op when `current` is None.
+    """
+    if current is None:
+        yield
+        return
+
+    thread_id = threading.get_ident()
+    _current.profile = current
+    current.thread_ids.add(thread_id)
+    try:
+        yield
+    finally:
+        current.thread_ids.discard(thread_id)
+        _current.profile = None
+
+def write_profile(current, path):
+    """Folded stacks to `path`, captured SQL to `path`.sql"""
+    with open(path, "w") as f:
+        f.write(current.to_folded() + "\n")
+    with open(path + ".sql", "w") as f:
+        for statement, ms in current.sql:
+            f.write(f"-- {ms:.2f} ms\n{statement};\n\n")
+
+@contextmanager
+def profile_from_env(label, interval=0.005):
+    """
+    Profile a script when PROFILE_OUTPUT names a directory, writing
+    <label>.folded there; a no-op otherwise.
+    """
+    output_dir = os.getenv("PROFILE_OUTPUT")
+    if not output_dir:
+        yield None
+        return
+
+    os.makedirs(output_dir, exist_ok=True)
+    with profile(label, interval) as current:
+        yield current
+
+    path = os.path.join(output_dir, f"{label}.folded")
+    write_profile(current, path)
+    print(f"Wrote profile ({current.duration_ms:.0f} ms, {len(current.sql)} queries) to {path}")
@@ -0,0 +1,151 @@
+"""
+User-partitioned sharding of the serving engine.
+
+Users are assigned to shards by a consistent hash ring over user_id, so going
+from N to N+1 shards moves only about 1/(N+1) of them. Each shard file holds
+only its users' ALS factors; the item side (item factors, content matrices,
+cold-start and filter indexes) is written once, uncompressed, and every shard
+process memory-maps it read-only so it is shared through the page cache.
+
+    python -m services.ml.sharding --shards 4
+"""
+import argparse
+import bisect
+import copy
+import hashlib
+import json
+import os
+
+import joblib
+import numpy as np
+
+ARTIFACTS_PATH = os.getenv("ML_ARTIFACTS_PATH", "/app/services/ml/artifacts/")
+SHARDS_PATH = os.getenv("SHARDS_PATH", os.path.join(ARTIFACTS_PATH, "shards"))
+
+ITEMS_FILENAME = "items.joblib"
+MANIFEST_FILENAME = "shards.json"
+
+# Ring points per shard; more points give a more even split
+VIRTUAL_NODES = int(os.getenv("SHARD_VIRTUAL_NODES", "128"))
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring mapping user_ids to shard numbers"""
+
+    def __init__(self, num_shards, virtual_nodes=VIRTUAL_NODES):
+        if num_shards < 1:
+            raise ValueError("num_shards must be at least 1")
+        points = sorted(
+            (_hash(f"shard-{shard}#{v}"), shard)
+            for shard in range(num_shards)
+            for v in range(virtual_nodes)
+        )
+        self.num_shards = num_shards
+        self.virtual_nodes = virtual_nodes
+        self._points = [p for p, _ in points]
+        self._shards = [s for _, s in points]
+
+    def shard_for(self, user_id):
+        i = bisect.bisect(self._points, _hash(str(int(user_id))))
+        return self._shards[i % len(self._points)]
+
+    def partition(self, user_ids):
+        """{shard: [user_id, ...]} preserving input order within each shard"""
+        groups = {}
+        for user_id in user_ids:
+            groups.setdefault(self.shard_for(user_id), []).append(user_id)
+        return groups
+
+
+def _shard_path(shards_path, shard_id):
+    return os.path.join(shards_path, f"shard-{shard_id}.joblib")
+
+def _item_engine(engine):
+    """Shallow copy of the engine with every per-user structure removed"""
+    items = copy.copy(engine)
+    items.cf_model = copy.copy(engine.cf_model)
+    items.cf_model.user_factors = np.empty((0, engine.cf_model.item_factors.shape[1]), dtype=np.float32)
+    items.user_map = {}
+    items.user_factor_overlay = {}
+    # The raw ALS artifacts carry the full interaction matrix; keep only the item map
+    items.cf_artifacts = {'anime_map': engine.item_map, 'version': engine.cf_artifacts.get('version', 1)}
+    return items
+
+def build_shards(engine, num_shards, shards_path=SHARDS_PATH, virtual_nodes=VIRTUAL_NODES):
+    """
+    Split a HybridRecommender into one user-factor file per shard plus a
+    shared item file. Folded-in users are included with their overlay factors.
+    """
+    ring = HashRing(num_shards, virtual_nodes)
+    os.makedirs(shards_path, exist_ok=True)
+
+    user_factors = np.asarray(engine.cf_model.user_factors, dtype=np.float32)
+    user_ids = list(dict.fromkeys([*engine.user_map, *engine.user_factor_overlay]))
+    groups = ring.partition(user_ids)
+
+    num_users = []
+    for shard_id in range(num_shards):
+        members = groups.get(shard_id, [])
+        factors = np.empty((len(members), user_factors.shape[1]), dtype=np.float32)
+        for row, user_id in enumerate(members):
+            if user_id in engine.user_factor_overlay:
+                factors[row] = engine.user_factor_overlay[user_id]
+            else:
+                factors[row] = user_factors[engine.user_map[user_id]]
+
+        joblib.dump({
+            'shard_id': shard_id,
+            'num_shards': num_shards,
+            'virtual_nodes': virtual_nodes,
+            'user_map': {user_id: row for row, user_id in enumerate(members)},
+            'user_factors': factors,
+        }, _shard_path(shards_path, shard_id))
+        num_users.append(len(members))
+
+    # Uncompressed so shard processes can memory-map the arrays
+    joblib.dump(_item_engine(engine), os.path.join(shards_path, ITEMS_FILENAME))
+
+    manifest = {'num_shards': num_shards, 'virtual_nodes': virtual_nodes, 'num_users': num_users}
+    with open(os.path.join(shards_path, MANIFEST_FILENAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    print(f"Wrote {num_shards} shards to {shards_path} (users per shard: {num_users})")
+    return manifest
+
+def load_shard_engine(shard_id, shards_path=SHARDS_PATH):
+    """Engine serving one shard: memory-mapped item data plus this shard's users only"""
+    shard = joblib.load(_shard_path(shards_path, shard_id))
+    engine = joblib.load(os.path.join(shards_path, ITEMS_FILENAME), mmap_mode="r")
+
+    engine.user_map = shard['user_map']
+    engine.cf_model.user_factors = shard['user_factors']
+    virtual_nodes = shard.get('virtual_nodes')
+    if virtual_nodes is None:
+        # Shard files written before the ring parameters were stored per shard
+        with open(os.path.join(shards_path, MANIFEST_FILENAME)) as f:
+            virtual_nodes = json.load(f)['virtual_nodes']
+
+    engine.shard = {
+        'shard_id': shard['shard_id'],
+        'num_shards': shard['num_shards'],
+        'virtual_nodes': virtual_nodes,
+        'num_users': len(shard['user_map']),
+    }
+    print(f"Loaded shard {shard_id}/{shard['num_shards']} with {len(shard['user_map'])} users")
+    return engine
+
+
+if __name__ == "__main__":
+    from .hybrid_model import HybridRecommender
+
+    parser = argparse.ArgumentParser(description="Split the hybrid engine into user shards")
+    parser.add_argument("--shards", type=int, required=True)
+    parser.add_argument("--virtual-nodes", type=int, default=VIRTUAL_NODES)
+    parser.add_argument("--output", default=SHARDS_PATH)
+    args = parser.parse_args()
+
+    build_shards(HybridRecommender(), args.shards, args.output, args.virtual_nodes)
@@ -0,0 +1,111 @@
+import numpy as np
+
+import joblib
+import os
+
+from scipy.sparse import issparse
+
+from .content_model import CONTENT_MODE
+
+ARTIFACTS_PATH = os.getenv("ML_ARTIFACTS_PATH", "/app/services/ml/artifacts/")
+MODEL_FILENAME = "similar_items_artifacts.joblib"
+
+CF_ARTIFACTS_PATH = os.path.join(ARTIFACTS_PATH, "als_model_artifacts.joblib")
+CB_ARTIFACTS_PATH = os.path.join(ARTIFACTS_PATH, "content_model_artifacts.joblib")
+
+# Neighbors kept per anime; larger k leaves room for genre/type filters at read time
+SIMILAR_K = int(os.getenv("SIMILAR_ITEMS_K", "50"))
+# Blend weight of TF-IDF similarity vs ALS item-item similarity
+CONTENT_WEIGHT = float(os.getenv("SIMILAR_ITEMS_CONTENT_WEIGHT", "0.7"))
+
+
+def _aligned_item_factors(cf_artifacts, anime_ids):
+    """L2-normalized ALS item factors in anime_ids order; zero rows for anime ALS never saw."""
+    item_factors = np.asarray(cf_artifacts['model'].item_factors, dtype=np.float32)
+    anime_map = cf_artifacts['anime_map']
+
+    aligned = np.zeros((len(anime_ids), item_factors.shape[1]), dtype=np.float32)
+    for row, aid in enumerate(anime_ids):
+        idx = anime_map.get(aid)
+        if idx is not None:
+            aligned[row] = item_factors[idx]
+
+    norms = np.linalg.norm(aligned, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return aligned / norms
+
+def build_neighbor_index(cb_artifacts, cf_artifacts, k=SIMILAR_K, content_weight=CONTENT_WEIGHT,
+                         content_mode=CONTENT_MODE, chunk_size=1024):
+    """
+    Top-k neighbors per anime by blended similarity:
+        content_weight * cos(content) + (1 - content_weight) * cos(ALS item factors)
+    where content vectors are TF-IDF rows ("sparse") or LSA embeddings ("dense").
+    Rows are sorted by anime_id so lookups are a searchsorted over an int32 array.
+    Similarities are computed chunk by chunk so the full N x N matrix is never held.
+    """
+    anime_df = cb_artifacts['anime_df'].sort_values('anime_id')
+    anime_ids = anime_df['anime_id'].to_numpy(dtype=np.int32)
+    n = len(anime_ids)
+    k = min(k, n - 1)
+
+    if content_mode == 'dense':
+        # Embedding rows follow the original anime_df order
+        X = cb_artifacts['embeddings'][anime_df.index.to_numpy()]
+    else:
+        X = cb_artifacts['tfidf'].transform(anime_df['synopsis'].fillna(""))
+    F = _aligned_item_factors(cf_artifacts, anime_ids)
+
+    neighbor_ids = np.empty((n, k), dtype=np.int32)
+    neighbor_scores = np.empty((n, k), dtype=np.float32)
+
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        content_sim = X[start:stop] @ X.T
+        if issparse(content_sim):
+            content_sim = content_sim.toarray()
+
+        sim = content_weight * content_sim + (1.0 - content_weight) * (F[start:stop] @ F.T)
+        # Exclude the item itself
+        sim[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+
+        top = np.argpartition(-sim, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(sim, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+
+        neighbor_ids[start:stop] = anime_ids[np.take_along_axis(top, order, axis=1)]
+        neighbor_scores[start:stop] = np.take_along_axis(top_scores, order, axis=1)
+
+    return {
+        "anime_ids": anime_ids,
+        "neighbor_ids": neighbor_ids,
+        "neighbor_scores": neighbor_scores,
+        "titles": anime_df['title'].to_numpy(dtype=object),
+        "anime_types": anime_df['type'].to_numpy(dtype=object),
+        "k": k,
+        "content_weight": content_weight,
+    }
+
+
+def save_model(model_artifacts, path):
+    try:
+        joblib.dump(model_artifacts, path)
+        print(f"Successfully saved similar-items index to {path}")
+    except Exception as e:
+        print(f"Error saving similar-items index: {e}")
+
+if __name__ == "__main__":
+    os.makedirs(ARTIFACTS_PATH, exist_ok=True)
+
+    try:
+        cf = joblib.load(CF_ARTIFACTS_PATH)
+        cb = joblib.load(CB_ARTIFACTS_PATH)
+    except FileNotFoundError as e:
+        raise FileNotFoundError(
+            "Model artifacts not found. Run content_model.py and als_model.py first."
+        ) from e
+
+    index = build_neighbor_index(cb, cf)
+    print(f"Built {index['k']} neighbors for {len(index['anime_ids'])} anime")
+
+    full_path = os.path.join(ARTIFACTS_PATH, MODEL_FILENAME)
+    save_model(index, full_path)
@@ -0,0 +1,168 @@
+"""
+Versioned columnar snapshots of the training inputs.
+
+Each snapshot is a Parquet file under SNAPSHOT_PATH/<name>/<version>.parquet,
+where the version hashes the row count and checksum of every source table.
+Reads refresh the file only when a source table changed, then load it with
+column projection and memory mapping. With SNAPSHOT_OFFLINE=1 the latest
+snapshot is used without touching the database at all.
+
+Fingerprints cost a scan of the source table, so each is computed at most
+once per process (training scripts assume their inputs do not change under
+them). The pipeline hands the fingerprints it already computed to each step
+through SNAPSHOT_FINGERPRINTS, so a step only scans tables nobody has yet.
+
+    python -m services.ml.snapshot          # refresh every snapshot
+"""
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from sqlalchemy import text
+
+from .db import engine
+
+ARTIFACTS_PATH = os.getenv("ML_ARTIFACTS_PATH", "/app/services/ml/artifacts/")
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", os.path.join(ARTIFACTS_PATH, "snapshots"))
+
+# Loaders read snapshots instead of querying Postgres
+USE_SNAPSHOTS = os.getenv("USE_SNAPSHOTS", "1") == "1"
+# Trust the latest snapshot without checking source tables
+SNAPSHOT_OFFLINE = os.getenv("SNAPSHOT_OFFLINE", "0") == "1"
+
+# {table: fingerprint} known to this process, seeded by the pipeline
+_fingerprints = json.loads(os.getenv("SNAPSHOT_FINGERPRINTS", "{}"))
+
+SNAPSHOTS = {
+    "anime": {
+        "tables": ["anime"],
+        "query": """
+            SELECT anime_id, title, synopsis, year, type, rating, episodes,
+                   score, rank, popularity, members, favorites
+            FROM anime
+        """,
+        "dtypes": {
+            "anime_id": "int32", "year": "Int16", "episodes": "Int32", "score": "float32",
+            "rank": "Int32", "popularity": "Int32", "members": "Int32", "favorites": "Int32",
+        },
+    },
+    "user_ratings": {
+        "tables": ["user_ratings"],
+        "query": """
+            SELECT user_id, anime_id, rating, source
+            FROM user_ratings
+            ORDER BY user_id
+        """,
+        "dtypes": {"user_id": "int32", "anime_id": "int32", "rating": "float32"},
+    },
+    "anime_genres": {
+        "tables": ["anime_genres", "genres"],
+        "query": """
+            SELECT ag.anime_id, g.name AS genre
+            FROM anime_genres ag
+            JOIN genres g ON ag.genre_id = g.genre_id
+        """,
+        "dtypes": {"anime_id": "int32"},
+    },
+    "anime_studios": {
+        "tables": ["anime_studios", "studios"],
+        "query": """
+            SELECT ast.anime_id, s.name AS studio
+            FROM anime_studios ast
+            JOIN studios s ON ast.studio_id = s.studio_id
+        """,
+        "dtypes": {"anime_id": "int32"},
+    },
+}
+
+
+def table_fingerprint(table, refresh=False):
+    """
+    Row count plus an order-independent checksum of every row. Cached per
+    process; refresh=True rescans (e.g. after the caller wrote the table).
+    """
+    if not refresh and table in _fingerprints:
+        return _fingerprints[table]
+
+    query = text(f"""
+        SELECT count(*), md5(coalesce(string_agg(h, '' ORDER BY h), ''))
+        FROM (SELECT md5(t::text) AS h FROM {table} t) rows
+    """)
+    with engine.connect() as conn:
+        count, checksum = conn.execute(query).one()
+    _fingerprints[table] = f"{count}:{checksum}"
+    return _fingerprints[table]
+
+def snapshot_version(name):
+    digest = hashlib.sha256()
+    for table in SNAPSHOTS[name]["tables"]:
+        digest.update(f"{table}={table_fingerprint(table)};".encode())
+    return digest.hexdigest()[:16]
+
+
+def _snapshot_dir(name):
+    return os.path.join(SNAPSHOT_PATH, name)
+
+def _latest_version(name):
+    try:
+        with open(os.path.join(_snapshot_dir(name), "LATEST")) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+def export_snapshot(name, version):
+    spec = SNAPSHOTS[name]
+    df = pd.read_sql(spec["query"], engine).astype(spec["dtypes"])
+
+    directory = _snapshot_dir(name)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{version}.parquet")
+    tmp_path = path + ".tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+    with open(os.path.join(directory, "LATEST.tmp"), "w") as f:
+        f.write(version)
+    os.replace(os.path.join(directory, "LATEST.tmp"), os.path.join(directory, "LATEST"))
+
+    print(f"Exported snapshot {name}@{version} ({len(df)} rows)")
+    return path
+
+def refresh_snapshot(name):
+    """Path to an up-to-date snapshot, exporting a new version if a source table changed"""
+    if SNAPSHOT_OFFLINE:
+        version = _latest_version(name)
+        if version is None:
+            raise FileNotFoundError(f"No snapshot for {name}; run services.ml.snapshot first.")
+    else:
+        version = snapshot_version(name)
+
+    path = os.path.join(_snapshot_dir(name), f"{version}.parquet")
+    if not os.path.exists(path):
+        path = export_snapshot(name, version)
+    return path
+
+def read_snapshot(name, columns=None):
+    """Load a snapshot, reading only `columns` from a memory-mapped file"""
+    # Imported here: serving processes import this module through the model
+    # code but never read snapshots, and pyarrow is only an ML requirement
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(refresh_snapshot(name), columns=columns, memory_map=True)
+    # Ignore pandas metadata so nullable ints come back as float/NaN, like pd.read_sql
+    return table.to_pandas(ignore_metadata=True)
+
+def iter_snapshot(name, columns=None, batch_size=65536):
+    """Stream a snapshot as DataFrames of at most `batch_size` rows"""
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(refresh_snapshot(name), memory_map=True)
+    for batch in parquet.iter_batches(batch_size=batch_size, columns=columns):
+        yield batch.to_pandas(ignore_metadata=True)
+
+
+if __name__ == "__main__":
+    for snapshot_name in SNAPSHOTS:
+        print(f"{snapshot_name}: {refresh_snapshot(snapshot_name)}")
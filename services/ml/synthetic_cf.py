@@ -2,10 +2,28 @@ import numpy as np
 import pandas as pd
 
 from .db import engine
+from .snapshot import USE_SNAPSHOTS, read_snapshot
 
 from sqlalchemy import create_engine
 
 def load_anime():
+    if USE_SNAPSHOTS:
+        anime = read_snapshot("anime", columns=["anime_id", "rank"]).dropna(subset=["rank"])
+        df = anime.merge(read_snapshot("anime_genres"), on="anime_id")
+    else:
+        df = _query_anime_genres()
+
+    return (
+        df.groupby("anime_id")
+        .agg({
+            "rank": "first",
+            "genre": lambda x: list(set(x))
+        })
+        .reset_index()
+        .rename(columns={"genre": "genres"})
+    )
+
+def _query_anime_genres():
     query = """
         SELECT
             a.anime_id,
@@ -17,17 +35,7 @@ def load_anime():
         WHERE a.rank IS NOT NULL
     """
 
-    df = pd.read_sql(query, engine)
-    
-    return (
-        df.groupby("anime_id")
-        .agg({
-            "rank": "first",
-            "genre": lambda x: list(set(x))
-        })
-        .reset_index()
-        .rename(columns={"genre": "genres"})
-    )
+    return pd.read_sql(query, engine)
     
 def generate_synthetic_user_ratings(anime, all_genres, num_users=10_000, ratings_per_user=50):
     ratings = []